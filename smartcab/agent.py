@@ -1,21 +1,31 @@
-import random
+import os
 import math
+import numpy as np
+from timeit import default_timer as timer
 from environment import Agent, Environment
 from planner import RoutePlanner
-from simulator import Simulator
+from headless import HeadlessSimulator
+import qtable
+from qtable import QTable, STATE_CODES, STATES, ACTION_INDEX
+from telemetry import Telemetry, STEPS, TRIALS
+from profiler import Profiler
+from replay import TrialRecorder
+from experience import ExperienceBuffer, q_update
 
 class LearningAgent(Agent):
     """An agent that learns to drive in the smartcab world."""
 
-    def __init__(self, env, sigmoid_offset=8., sigmoid_rate=0.01, alpha_decay=0.1, gamma=0.5):
+    def __init__(self, env, sigmoid_offset=8., sigmoid_rate=0.01, alpha_decay=0.1, gamma=0.5, replay_capacity=0, replay_batch=512, replay_every=128,
+                 q_table=None, global_t=0.):
+        """q_table (a QTable) and global_t continue learning from an existing table and step count instead of an
+        empty one."""
         super(LearningAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
         self.color = 'red'  # override color
         self.planner = RoutePlanner(self.env, self)  # simple route planner to get next_waypoint
 
         # TODO: Initialize any additional variables here
-        self.qtable = {}  # Q-value table: key = state-action, value = Q-value
         self.prev_sa = None  # keep track of previous state-action
-        self.global_t = 0.  # keep track of global time, i.e. how many times agent performs update function
+        self.init_global_t(global_t)  # keep track of global time, i.e. how many times agent performs update function
         self.net_reward = 0
         self.penalties = 0  # number of times a penalty (reward < 0) was incurred
 
@@ -26,6 +36,21 @@ class LearningAgent(Agent):
         self.ALPHA_DECAY = alpha_decay  # learning rate: alpha = (global_t + 1)**(-ALPHA_DECAY)
         self.GAMMA = gamma  # discount factor
 
+        self.q = q_table if q_table is not None else QTable(self.INITIAL_Q)  # Q-value table: rows = state codes, columns = actions
+        self.policy = None  # frozen greedy policy: state code -> action, see freeze()
+
+        # Experience replay (if replay_capacity > 0): instead of one update per step, store transitions and learn from
+        # a random minibatch of replay_batch of them (all of them if None) every replay_every steps. A minibatch update
+        # has a fixed cost of some 50 us, so it only makes acting cheaper when it runs every few dozen steps or less.
+        # Replayed targets bootstrap from the next state (standard Q-learning), not from the current state like the
+        # update below, since the next state of a stored transition is known.
+        self.replay = ExperienceBuffer(replay_capacity) if replay_capacity > 0 else None
+        self.REPLAY_BATCH = replay_batch
+        self.REPLAY_EVERY = replay_every
+        self.replay_random = np.random.RandomState(self.env.random.randint(0, 2**32 - 1)) if self.replay is not None else None
+        self.replay_steps = 0
+        self.pending = None  # (state, action, reward) of the last step, until the next state is known
+
         #print '%f, %f, %f, %f' % (self.SIGMOID_OFFSET, self.SIGMOID_RATE, self.ALPHA_DECAY, self.GAMMA)  # [debug]
 
     def reset(self, destination=None):
@@ -33,24 +58,36 @@ class LearningAgent(Agent):
         # TODO: Prepare for a new trip; reset any variables here, if required
         self.net_reward = 0
         self.penalties = 0
+        self.pending = None  # the last trial ran out of time; its last step has no next state to learn from
 
     def update(self, t):
+        if self.policy is not None:
+            # Frozen: lookup-and-act, no exploration or learning; still keep the counters that trials are scored on
+            self.next_waypoint = self.planner.next_waypoint()
+            inputs = self.env.sense(self)
+            s = STATE_CODES[(self.next_waypoint, inputs['light'], inputs['oncoming'], inputs['left'])]
+            self.state = STATES[s]
+            reward = self.env.act(self, self.policy[s])
+            self.net_reward += reward
+            if reward < 0:
+                self.penalties += 1
+            return
+
         # Gather inputs
         self.next_waypoint = self.planner.next_waypoint()  # from route planner, also displayed by simulator
         inputs = self.env.sense(self)
         deadline = self.env.get_deadline(self)
 
         # TODO: Update state
-        state = (self.next_waypoint, inputs['light'], inputs['oncoming'], inputs['left'], inputs['right'])
+        # Ignore 'right' altogether, since traffic on the right has no effect on our driving agent (see compress_sa)
+        s = STATE_CODES[(self.next_waypoint, inputs['light'], inputs['oncoming'], inputs['left'])]
 
         # Update self.state with compressed state, so the GUI can report it
-        self.state = self.compress_sa(state, None)[0:4]
+        self.state = STATES[s]
 
-        # If Q-value does not exist for current state (any action), make initial Q-value = 0
-        valid_actions = [None, 'forward', 'left', 'right']
-        for action in valid_actions:
-            if self.compress_sa(state, action) not in self.qtable:
-                self.qtable[self.compress_sa(state, action)] = self.INITIAL_Q
+        # Q-values for current state (any action), initially INITIAL_Q
+        self.q.visited[s] = True
+        qs = self.q.values[s]
 
         # TODO: Select action according to your policy
         # Choose between the following two policies randomly, choosing the random policy with decreasing probability as t increases
@@ -58,13 +95,14 @@ class LearningAgent(Agent):
         #   * Random policy (minimum probability of choosing random policy is MIN_RAND_PROB)
         #   * Given our current state, choose the action with maximum Q(state, action) value
         prob_q = 1/(1 + math.exp(-self.SIGMOID_RATE*self.global_t + self.SIGMOID_OFFSET))  # sigmoid function
-        threshold = random.uniform(0, 1)
+        threshold = self.env.random.uniform(0, 1)
 
         if prob_q >= threshold:
-            qs = [self.qtable[self.compress_sa(state, None)], self.qtable[self.compress_sa(state, 'forward')], self.qtable[self.compress_sa(state, 'left')], self.qtable[self.compress_sa(state, 'right')]]
-            action = valid_actions[qs.index(max(qs))]
+            a = int(qs.argmax())
+            action = Environment.valid_actions[a]
         else:
-            action = random.choice(valid_actions)
+            action = self.env.random.choice(Environment.valid_actions)
+            a = ACTION_INDEX[action]
 
         # Execute action and get reward
         reward = self.env.act(self, action)
@@ -75,11 +113,20 @@ class LearningAgent(Agent):
             self.penalties += 1
 
         # TODO: Learn policy based on state, action, reward
-        sa = self.compress_sa(state, action)
-        new_q = reward + self.GAMMA * max([self.qtable[self.compress_sa(state, a)] for a in valid_actions])
+        profiler = self.env.profiler
+        if profiler is not None:
+            start = timer()
 
-        alpha = (self.global_t + 1)**(-self.ALPHA_DECAY)
-        self.qtable[sa] = (1 - alpha) * self.qtable[sa] + alpha * new_q
+        if self.replay is None:
+            new_q = reward + self.GAMMA * qs.max()  # bootstraps from the current state (replay uses the next state)
+
+            alpha = (self.global_t + 1)**(-self.ALPHA_DECAY)
+            qs[a] = (1 - alpha) * qs[a] + alpha * new_q
+        else:
+            self.remember(s, a, reward)
+
+        if profiler is not None:
+            profiler.add('learn', timer() - start)
 
         #print "LearningAgent.update(): deadline = {}, inputs = {}, action = {}, reward = {}".format(deadline, inputs, action, reward)  # [debug]
         #if t%10 == 0:  # [debug]
@@ -89,8 +136,54 @@ class LearningAgent(Agent):
         self.global_t += 1.
         #print 'Global time: %i' % self.global_t  # [debug]
 
-        # Report net_reward and number of penalties
-        print 'Net reward: %i, # of penalties: %i' % (self.net_reward, self.penalties)
+        # Record the step, and report net_reward and number of penalties
+        telemetry = self.env.telemetry
+        if telemetry.record_steps:
+            telemetry.record_step(t, s, a, reward, deadline)
+        if telemetry.verbosity >= STEPS:
+            telemetry.log(STEPS, 'Net reward: %i, # of penalties: %i' % (self.net_reward, self.penalties))
+
+    def init_global_t(self, global_t):
+        """Start counting steps from global_t (a subclass may keep its count elsewhere)."""
+        self.global_t = global_t
+
+    def remember(self, s, a, reward):
+        """Store transitions in the replay buffer and learn from a minibatch every REPLAY_EVERY steps.
+
+        The transition of the previous step is completed with its next state s; reaching the destination is terminal.
+        """
+        if self.pending is not None:
+            self.replay.add(self.pending[0], self.pending[1], self.pending[2], s)
+        if self.env.success:
+            self.replay.add(s, a, reward, s, True)
+            self.pending = None
+        else:
+            self.pending = (s, a, reward)
+
+        self.replay_steps += 1
+        if self.replay_steps % self.REPLAY_EVERY == 0 and len(self.replay) > 0:
+            alpha = (self.global_t + 1)**(-self.ALPHA_DECAY)
+            q_update(self.q.values, self.replay.sample(self.replay_random, self.REPLAY_BATCH), alpha, self.GAMMA)
+
+    def freeze(self):
+        """Stop learning and always take the greedy action of the current Q-table (until unfreeze())."""
+        self.policy = [Environment.valid_actions[a] for a in qtable.greedy_policy(self.q.values)]
+
+    def unfreeze(self):
+        self.policy = None
+
+    def save_checkpoint(self, path):
+        """Save the Q-table and global_t (which drives epsilon and alpha decay) to path."""
+        qtable.save_checkpoint(path, self.q, self.global_t)
+
+    def load_checkpoint(self, path, mmap_mode=None):
+        """Continue learning from a checkpoint written by save_checkpoint (see qtable.load_checkpoint)."""
+        self.q, self.global_t = qtable.load_checkpoint(path, mmap_mode)
+
+    @property
+    def qtable(self):
+        """Q-value table as a dict: key = compressed state-action (see compress_sa), value = Q-value"""
+        return self.q.to_dict()
 
     def compress_sa(self, state, action):
         """Given state, action pair, compress it into a smaller representation space"""
@@ -111,16 +204,72 @@ class LearningAgent(Agent):
 
 
 def run(*args, **kwargs):
-    """Run the agent for a finite number of trials."""
+    """Run the agent for a finite number of trials (pass headless=True to skip the pygame window).
+
+    With the same seed, a run reproduces the exact same trajectory. verbosity is one of the levels in telemetry.py;
+    with telemetry_path, per-trial and per-step records are saved there (.npz or .csv) at the end of the run.
+    A Telemetry object can also be passed in as telemetry, to read its records afterwards.
+    env_options are passed on to Environment, e.g. {'grid_size': (100, 100), 'traffic_density': 0.1}.
+    With checkpoint_path, the Q-table is saved there every checkpoint_every trials (unless 0) and at the end, and a run resumes
+    from it if it exists; otherwise warm_start starts from another checkpoint (e.g. a shared pretrained table).
+    With profile=True, phase timings are collected and reported at the end of the run.
+    With render_fps, the pygame window shows the training live at that frame rate without slowing it down.
+    With record_path, every trial is recorded there for replay (see replay.py); this cannot be combined with batched_traffic.
+    With frozen=True the agent does not learn or explore, e.g. to evaluate a checkpoint loaded with warm_start.
+    stopping_rule (see scoring.py) can end the run early once its outcome is settled; the score is then projected.
+    Pass a scoring.ScoreTracker as score_tracker to read the rolling statistics and the stop reason afterwards.
+    agent_class replaces LearningAgent (e.g. async_train.SharedLearningAgent); other arguments go to its constructor.
+    """
+    headless = kwargs.pop('headless', False)
+    n_trials = kwargs.pop('n_trials', 100)
+    seed = kwargs.pop('seed', None)
+    verbosity = kwargs.pop('verbosity', TRIALS)
+    telemetry_path = kwargs.pop('telemetry_path', None)
+    env_options = kwargs.pop('env_options', {})
+    checkpoint_path = kwargs.pop('checkpoint_path', None)
+    checkpoint_every = kwargs.pop('checkpoint_every', 10)
+    warm_start = kwargs.pop('warm_start', None)
+    profile = kwargs.pop('profile', False)
+    render_fps = kwargs.pop('render_fps', None)
+    record_path = kwargs.pop('record_path', None)
+    frozen = kwargs.pop('frozen', False)
+    agent_class = kwargs.pop('agent_class', LearningAgent)
+    stopping_rule = kwargs.pop('stopping_rule', None)
+    score_tracker = kwargs.pop('score_tracker', None)
+
+    telemetry = kwargs.pop('telemetry', None)
+    if record_path is not None and env_options.get('batched_traffic'):
+        raise ValueError("Trials with batched_traffic cannot be recorded (record_path = {})".format(record_path))
 
     # Set up environment and agent
-    e = Environment()  # create environment (also adds some dummy traffic)
-    a = e.create_agent(LearningAgent, *args, **kwargs)  # create agent
+    if telemetry is None:
+        telemetry = Telemetry(verbosity, record_steps=telemetry_path is not None)
+    e = Environment(seed=seed, telemetry=telemetry, **env_options)  # create environment (also adds some dummy traffic)
+    if profile:
+        e.set_profiler(Profiler())
+    if record_path is not None:
+        e.recorder = TrialRecorder()
+    a = e.create_agent(agent_class, *args, **kwargs)  # create agent
     e.set_primary_agent(a, enforce_deadline=True)  # set agent to track
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        a.load_checkpoint(checkpoint_path)  # resume, even if the run was first started from warm_start
+    elif warm_start is not None:
+        a.load_checkpoint(warm_start, mmap_mode='c')
+    if frozen:
+        a.freeze()
 
     # Now simulate it
-    sim = Simulator(e, update_delay=0.)  # reduce update_delay to speed up simulation
-    score = sim.run(n_trials=100)  # press Esc or close pygame window to quit
+    if headless:
+        sim = HeadlessSimulator(e, checkpoint_path, checkpoint_every, stopping_rule, score_tracker)  # no rendering, no frame delays
+    else:
+        from simulator import Simulator  # only import pygame when a window is requested
+        sim = Simulator(e, update_delay=0., checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every, render_fps=render_fps,
+                        stopping_rule=stopping_rule, tracker=score_tracker)  # reduce update_delay to speed up simulation
+    score = sim.run(n_trials=n_trials)  # press Esc or close pygame window to quit
+    if telemetry_path is not None:
+        telemetry.save(telemetry_path)
+    if record_path is not None:
+        e.recorder.save(record_path)
 
     return score
 
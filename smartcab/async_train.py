@@ -0,0 +1,96 @@
+import argparse
+import multiprocessing
+import time
+from Queue import Empty
+
+import agent
+import qtable
+from agent import LearningAgent
+from evaluate import evaluate_policy
+from qtable import SharedQTable
+from telemetry import Telemetry, SILENT
+
+
+class SharedLearningAgent(LearningAgent):
+    """LearningAgent that updates a SharedQTable, together with the agents of other processes.
+
+    Its global_t (which drives exploration and learning rate decay) is the table's shared step counter.
+    """
+
+    def __init__(self, env, q_table, **kwargs):
+        super(SharedLearningAgent, self).__init__(env, q_table=q_table, **kwargs)
+
+    def init_global_t(self, global_t):
+        """Keep the shared step count, which other agents may already have advanced."""
+
+    @property
+    def global_t(self):
+        return self.q.shared_global_t.value
+
+    @global_t.setter
+    def global_t(self, value):
+        self.q.shared_global_t.value = value
+
+    def load_checkpoint(self, path, mmap_mode=None):
+        """Copy a checkpoint into the shared table (affects all agents sharing it)."""
+        self.q.load(*qtable.load_checkpoint(path))
+
+
+def worker(shared, seed, n_trials, config, env_options, results):
+    """Train one SharedLearningAgent in its own environment; put (seed, score) on the results queue."""
+    score = agent.run(headless=True, n_trials=n_trials, seed=seed, telemetry=Telemetry(SILENT), env_options=env_options,
+                      agent_class=SharedLearningAgent, q_table=shared, **config)
+    results.put((seed, score))
+
+
+def train(n_workers=None, n_trials=100, seed=0, config=None, env_options=None, warm_start=None, checkpoint_path=None):
+    """Train n_workers agents (default: one per core) in parallel processes, all learning into one shared Q-table.
+
+    Worker i runs n_trials trials in its own Environment, with seed + i. config holds LearningAgent keyword arguments.
+    warm_start starts from a checkpoint; with checkpoint_path, the table is saved there at the end.
+    Return (the workers' scores in seed order, the SharedQTable).
+    """
+    n_workers = n_workers or multiprocessing.cpu_count()
+    seeds = [seed + i if seed is not None else None for i in xrange(n_workers)]
+    shared = SharedQTable()
+    if warm_start is not None:
+        shared.load(*qtable.load_checkpoint(warm_start))
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(shared, s, n_trials, config or {}, env_options or {}, results)) for s in seeds]
+    for w in workers:
+        w.start()
+    try:
+        scores = {}
+        while len(scores) < n_workers:
+            try:
+                s, score = results.get(timeout=1.)
+                scores[s] = score
+            except Empty:
+                if not any(w.is_alive() for w in workers) and results.empty():
+                    raise RuntimeError("{} worker(s) exited without a result".format(n_workers - len(scores)))
+    finally:
+        for w in workers:
+            if w.is_alive() and len(scores) < n_workers:
+                w.terminate()
+            w.join()
+
+    if checkpoint_path is not None:
+        qtable.save_checkpoint(checkpoint_path, shared, shared.shared_global_t.value)
+    return [scores[s] for s in seeds], shared
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train smartcab agents in parallel processes on one shared Q-table')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--trials', type=int, default=100, help='number of trials per worker')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first worker (the others use the next ones)')
+    parser.add_argument('--warm-start', metavar='PATH', help='checkpoint to start from')
+    parser.add_argument('--out', metavar='PATH', help='save the learned Q-table to this checkpoint')
+    args = parser.parse_args()
+
+    start = time.time()
+    scores, shared = train(args.workers, args.trials, args.seed, warm_start=args.warm_start, checkpoint_path=args.out)
+    print 'Trained %i workers x %i trials in %.1f s (%i steps)' % (len(scores), args.trials, time.time() - start, shared.shared_global_t.value)
+    print 'Worker scores: %s' % ', '.join('%.3f' % score for score in scores)
+    print 'Greedy policy: success rate = %.4f, mean steps = %.2f' % evaluate_policy(qtable.greedy_policy(shared.values), seed=0)
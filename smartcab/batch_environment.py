@@ -0,0 +1,218 @@
+import numpy as np
+
+from environment import Environment
+from planner import next_waypoints
+
+# Actions, waypoints and sensed traffic are encoded as indices into Environment.valid_actions
+NONE, FORWARD, LEFT, RIGHT = range(len(Environment.valid_actions))
+
+
+def dummy_blocked(waypoint, green, oncoming, left):
+    """Whether dummy agents may not take their waypoints (DummyAgent.update's rules, on arrays of action codes)."""
+    return (((waypoint == RIGHT) & ~green & (left == FORWARD)) |
+            ((waypoint == FORWARD) & ~green) |
+            ((waypoint == LEFT) & (~green | (oncoming == FORWARD) | (oncoming == RIGHT))))
+
+
+class BatchEnvironment(object):
+    """Many independent smartcab worlds stored as NumPy arrays and stepped together.
+
+    Every world has the same layout as Environment: agents 0..num_dummies-1 are dummy agents and agent
+    num_dummies is the primary agent, updated in that order each tick (with batched_traffic, the dummy agents all
+    sense first and then move at once, like the cars of a TrafficController). Lights are True when NS is open.
+    """
+
+    def __init__(self, n_worlds, num_dummies=3, grid_size=(8, 6), enforce_deadline=True, seed=None, light_periods=(3, 4, 5),
+                 min_route_dist=4, deadline_factor=5, traffic_density=None, batched_traffic=False):
+        """Create n_worlds worlds, stepped with enforce_deadline and drawn from seed.
+
+        The other options mean the same as for Environment, so the same env_options work for both.
+        """
+        if min_route_dist > grid_size[0] + grid_size[1] - 2:
+            raise ValueError("min_route_dist = {} is larger than any distance on a {} grid".format(min_route_dist, grid_size))
+        if traffic_density is not None:
+            num_dummies = int(round(traffic_density * grid_size[0] * grid_size[1]))  # dummy agents per intersection
+        self.n_worlds = n_worlds
+        self.grid_size = grid_size  # (cols, rows)
+        self.num_dummies = num_dummies
+        self.num_agents = num_dummies + 1
+        self.primary = num_dummies  # index of the primary agent
+        self.enforce_deadline = enforce_deadline
+        self.batched_traffic = batched_traffic  # dummy agents move simultaneously
+        self.min_route_dist = min_route_dist
+        self.deadline_factor = deadline_factor
+        self.random = np.random.RandomState(seed)
+        self.worlds = np.arange(n_worlds)
+
+        # Traffic lights, indexed by (world, x - 1, y - 1)
+        shape = (n_worlds, grid_size[0], grid_size[1])
+        self.light_state = self.random.randint(0, 2, size=shape).astype(bool)
+        self.light_period = self.random.choice(light_periods, size=shape)
+        self.light_last_updated = np.zeros(shape, dtype=int)
+
+        # Agents, indexed by (world, agent); locations are 1-based like Environment.intersections
+        self.location = np.ones((n_worlds, self.num_agents, 2), dtype=int)
+        self.heading = np.zeros((n_worlds, self.num_agents, 2), dtype=int)
+        self.heading[:, :, 1] = 1
+        self.waypoint = np.zeros((n_worlds, self.num_agents), dtype=np.int8)
+        self.waypoint[:, :num_dummies] = self.random.randint(FORWARD, RIGHT + 1, size=(n_worlds, num_dummies))
+
+        # Primary agent trip
+        self.destination = np.ones((n_worlds, 2), dtype=int)
+        self.deadline = np.zeros(n_worlds, dtype=int)
+
+        self.t = np.zeros(n_worlds, dtype=int)
+        self.done = np.ones(n_worlds, dtype=bool)  # worlds need a reset() before stepping
+        self.success = np.zeros(n_worlds, dtype=bool)
+        self._observed = False
+
+    def reset(self, mask=None):
+        """Start a new trial in every world selected by mask (default: all worlds)."""
+        worlds = self.worlds if mask is None else self.worlds[mask]
+        n = len(worlds)
+        cols, rows = self.grid_size
+
+        self.done[worlds] = False
+        self.success[worlds] = False
+        self.t[worlds] = 0
+        self.light_last_updated[worlds] = 0
+
+        # Pick a start and a destination, resampling both while they are too close (same rule as Environment.reset)
+        start = np.empty((n, 2), dtype=int)
+        destination = np.empty((n, 2), dtype=int)
+        pending = np.ones(n, dtype=bool)
+        while pending.any():
+            k = pending.sum()
+            start[pending] = self._random_locations(k)
+            destination[pending] = self._random_locations(k)
+            pending = np.abs(destination - start).sum(axis=1) < self.min_route_dist
+
+        headings = np.array(Environment.valid_headings)
+        self.location[worlds, self.primary] = start
+        self.heading[worlds, self.primary] = headings[self.random.randint(0, 4, size=n)]
+        self.destination[worlds] = destination
+        self.deadline[worlds] = np.abs(destination - start).sum(axis=1) * self.deadline_factor
+
+        for i in xrange(self.num_dummies):
+            self.location[worlds, i] = self._random_locations(n)
+            self.heading[worlds, i] = headings[self.random.randint(0, 4, size=n)]
+
+        self._observed = False
+
+    def observe(self):
+        """Advance lights and dummy traffic for this tick; return the primary agent's inputs.
+
+        Inputs are arrays over worlds: waypoint, oncoming, left and right are action codes, light is True when green.
+        """
+        assert not self._observed, "observe() called twice without act()"
+        active = ~self.done
+
+        # Update traffic lights
+        t = self.t[:, None, None]
+        switch = ((t - self.light_last_updated) >= self.light_period) & active[:, None, None]
+        self.light_state ^= switch
+        self.light_last_updated = np.where(switch, t, self.light_last_updated)
+
+        # Update dummy agents, in creation order (with batched traffic, all of them sense before any of them moves)
+        sensed = [self.sense(i) for i in xrange(self.num_dummies)] if self.batched_traffic else None
+        for i in xrange(self.num_dummies):
+            green, oncoming, left, right = sensed[i] if sensed is not None else self.sense(i)
+            waypoint = self.waypoint[:, i]
+            moving = ~dummy_blocked(waypoint, green, oncoming, left) & active
+            actions = np.where(moving, waypoint, NONE)
+            self.waypoint[moving, i] = self.random.randint(FORWARD, RIGHT + 1, size=moving.sum())
+            self._act(i, actions, active)
+
+        # Sense for the primary agent
+        self.waypoint[:, self.primary] = next_waypoints(self.location[:, self.primary], self.heading[:, self.primary], self.destination)
+        green, oncoming, left, right = self.sense(self.primary)
+        self._observed = True
+
+        return {'waypoint': self.waypoint[:, self.primary].copy(), 'light': green, 'oncoming': oncoming, 'left': left,
+                'right': right, 'deadline': self.deadline.copy()}
+
+    def act(self, actions):
+        """Apply the primary agent's actions (codes, one per world), finish the tick and return its rewards.
+
+        Worlds that are already done are left untouched and get a reward of 0.
+        """
+        assert self._observed, "act() called before observe()"
+        self._observed = False
+        active = ~self.done
+        p = self.primary
+
+        rewards = self._act(p, np.asarray(actions), active)
+
+        # Reached destination
+        arrived = active & (self.location[:, p] == self.destination).all(axis=1)
+        rewards[arrived & (self.deadline >= 0)] += 10  # bonus
+        self.done |= arrived
+        self.success |= arrived
+
+        # Advance time and enforce deadline
+        self.t[active] += 1
+        if self.enforce_deadline:
+            self.done |= active & (self.deadline <= 0)
+        self.deadline[active] -= 1
+
+        return rewards
+
+    def step(self, policy):
+        """Run one tick, choosing primary actions with policy(inputs) -> action codes."""
+        return self.act(policy(self.observe()))
+
+    def sense(self, i):
+        """Return (green, oncoming, left, right) for agent i in every world, with Environment.sense priority rules."""
+        location = self.location[:, i]
+        heading = self.heading[:, i]
+        green = self._green(location, heading)
+
+        oncoming = np.zeros(self.n_worlds, dtype=np.int8)
+        left = np.zeros(self.n_worlds, dtype=np.int8)
+        right = np.zeros(self.n_worlds, dtype=np.int8)
+        for j in xrange(self.num_agents):
+            if j == i:
+                continue
+            other_heading = self.heading[:, j]
+            present = (self.location[:, j] == location).all(axis=1) & (other_heading != heading).any(axis=1)
+            is_oncoming = present & ((heading * other_heading).sum(axis=1) == -1)
+            is_right = present & ~is_oncoming & (heading[:, 1] == other_heading[:, 0]) & (-heading[:, 0] == other_heading[:, 1])
+            is_left = present & ~is_oncoming & ~is_right
+            waypoint = self.waypoint[:, j]
+
+            # Same overriding order as Environment.sense
+            oncoming = np.where(is_oncoming & (oncoming != LEFT), waypoint, oncoming)
+            right = np.where(is_right & (right != FORWARD) & (right != LEFT), waypoint, right)
+            left = np.where(is_left & (left != FORWARD), waypoint, left)
+
+        return green, oncoming, left, right
+
+    def _act(self, i, actions, active):
+        """Move agent i in every active world according to actions; return rewards (same rules as Environment.act)."""
+        location = self.location[:, i]
+        heading = self.heading[:, i]
+        green = self._green(location, heading)
+
+        move_okay = ~(((actions == FORWARD) | (actions == LEFT)) & ~green)
+        new_heading = heading.copy()
+        turn_left = actions == LEFT
+        turn_right = actions == RIGHT
+        new_heading[turn_left] = np.column_stack((heading[turn_left, 1], -heading[turn_left, 0]))
+        new_heading[turn_right] = np.column_stack((-heading[turn_right, 1], heading[turn_right, 0]))
+
+        moving = active & (actions != NONE) & move_okay
+        new_location = (location + new_heading - 1) % np.array(self.grid_size) + 1  # wrap-around
+        self.location[moving, i] = new_location[moving]
+        self.heading[moving, i] = new_heading[moving]
+
+        rewards = np.where(actions == NONE, 1., np.where(move_okay, np.where(actions == self.waypoint[:, i], 2., 0.5), -1.))
+        rewards[~active] = 0.
+        return rewards
+
+    def _green(self, location, heading):
+        ns_open = self.light_state[self.worlds, location[:, 0] - 1, location[:, 1] - 1]
+        return (ns_open & (heading[:, 1] != 0)) | (~ns_open & (heading[:, 0] != 0))
+
+    def _random_locations(self, n):
+        return np.column_stack((self.random.randint(1, self.grid_size[0] + 1, size=n),
+                                self.random.randint(1, self.grid_size[1] + 1, size=n)))
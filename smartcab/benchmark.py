@@ -0,0 +1,141 @@
+import argparse
+import json
+import math
+import sys
+import time
+from collections import OrderedDict
+
+import agent
+from agent import LearningAgent
+from environment import Environment
+from telemetry import Telemetry, SILENT
+
+GRID_SIZES = [(8, 6), (32, 32), (128, 128)]
+NUM_DUMMIES = [3, 100, 1000]
+TRIAL_COUNTS = [10, 100]
+
+
+def make_env(num_dummies, density=None, seed=0, grid_size=(8, 6), primary=False, batched_traffic=False):
+    """Environment with num_dummies dummy agents, and a LearningAgent as primary agent if primary is set.
+
+    With density (dummy agents per intersection), the square grid is sized to keep that density.
+    """
+    if density is not None:
+        side = max(int(math.ceil(math.sqrt(num_dummies / density))), 4)
+        grid_size = (side, side)
+    env = Environment(seed=seed, telemetry=Telemetry(SILENT), grid_size=grid_size, num_dummies=num_dummies, batched_traffic=batched_traffic)
+    if primary:
+        env.set_primary_agent(env.create_agent(LearningAgent), enforce_deadline=True)
+    env.reset()
+    return env
+
+
+def timed(fn, n, repeat=3):
+    """Best average time of n calls to fn over repeat runs, in seconds."""
+    best = float('inf')
+    for r in xrange(repeat):
+        start = time.time()
+        for i in xrange(n):
+            fn()
+        best = min(best, (time.time() - start) / n)
+    return best
+
+
+def bench_sense(env, n_calls=20000):
+    """Average cost of one Environment.sense call (for agents, not batched cars), in seconds."""
+    agents = list(env.agent_states)
+    sample = iter([env.random.choice(agents) for i in xrange(3 * n_calls)])
+    return timed(lambda: env.sense(next(sample)), n_calls)
+
+
+def bench_step(env, n_steps=20):
+    """Average cost of one Environment.step, per agent or car, in seconds."""
+    return timed(env.step, n_steps) / (len(env.agent_states) + (env.traffic.n_cars if env.traffic is not None else 0))
+
+
+def bench_update(env, n_calls=5000):
+    """Average cost of one LearningAgent.update call (including its sense and act), in seconds."""
+    return timed(lambda: env.primary_agent.update(env.t), n_calls)
+
+
+def bench_compress_sa(env, n_calls=20000):
+    state = ('forward', 'green', None, 'left', None)
+    return timed(lambda: env.primary_agent.compress_sa(state, 'right'), n_calls)
+
+
+def bench_trial(n_trials):
+    """Average cost of one trial of a headless agent.run(), in seconds."""
+    return timed(lambda: agent.run(headless=True, seed=0, verbosity=SILENT, n_trials=n_trials), 1) / n_trials
+
+
+def run_suite(quick=False):
+    """Run all benchmarks; return {benchmark name: seconds per operation}."""
+    results = OrderedDict()
+    scale = 10 if quick else 1
+    for grid_size in GRID_SIZES[:2] if quick else GRID_SIZES:
+        for num_dummies in NUM_DUMMIES[:2] if quick else NUM_DUMMIES:
+            case = 'grid=%ix%i,dummies=%i' % (grid_size + (num_dummies,))
+            env = make_env(num_dummies, grid_size=grid_size, primary=True)
+            results['Environment.step per agent [%s]' % case] = bench_step(env, max(20000 / (num_dummies * scale), 2))
+            results['Environment.sense [%s]' % case] = bench_sense(env, 20000 / scale)
+            results['LearningAgent.update [%s]' % case] = bench_update(env, 5000 / scale)
+    results['LearningAgent.compress_sa'] = bench_compress_sa(make_env(3, primary=True), 20000 / scale)
+    for n_trials in TRIAL_COUNTS[:1] if quick else TRIAL_COUNTS:
+        results['trial [n_trials=%i]' % n_trials] = bench_trial(n_trials)
+    return results
+
+
+def report(results, baseline=None, tolerance=0.2):
+    """Print results, compared to baseline if given; return names of benchmarks slower than baseline by > tolerance."""
+    regressions = []
+    print '%-60s %12s %14s %10s' % ('benchmark', 'us/op', 'ops/s', 'vs base')
+    for name, seconds in results.iteritems():
+        line = '%-60s %12.2f %14.0f' % (name, seconds * 1e6, 1. / seconds)
+        if baseline is not None and name in baseline:
+            ratio = seconds / baseline[name]
+            line += ' %9.2fx' % ratio
+            if ratio > 1 + tolerance:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print line
+    return regressions
+
+
+def scaling():
+    """Show sense()/step() cost as dummy traffic grows, on the 8x6 grid and at constant density (also batched)."""
+    for density, batched_traffic in [(None, False), (0.0625, False), (0.0625, True)]:
+        print 'Grid: {}{}'.format('8x6' if density is None else 'scaled to {} dummy agents per intersection'.format(density),
+                                  ', batched traffic' if batched_traffic else '')
+        print 'num_dummies  grid size  sense (us)  step per agent (us)'
+        for num_dummies in [3, 10, 100, 1000, 10000]:
+            env = make_env(num_dummies, density, primary=batched_traffic, batched_traffic=batched_traffic)
+            print '%11i  %9s  %10.2f  %19.2f' % (num_dummies, '%ix%i' % env.grid_size, bench_sense(env) * 1e6, bench_step(env) * 1e6)
+        print
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Smartcab hot-path benchmarks (headless)')
+    parser.add_argument('--quick', action='store_true', help='fewer cases and iterations')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results to a json baseline file')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a json baseline file; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown vs baseline (default: 0.2 = 20%%)')
+    parser.add_argument('--scaling', action='store_true', help='only run the traffic scaling table')
+    args = parser.parse_args()
+
+    if args.scaling:
+        scaling()
+        sys.exit(0)
+
+    results = run_suite(args.quick)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fi:
+            baseline = json.load(fi)
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fo:
+            json.dump(results, fo, indent=2)
+    if regressions:
+        print '%i regression(s) vs %s' % (len(regressions), args.compare)
+        sys.exit(1)
@@ -1,17 +1,21 @@
 import time
 import random
+import bisect
 from collections import OrderedDict
+from timeit import default_timer as timer
 
-from simulator import Simulator
+from telemetry import Telemetry, TRIALS
 
 class TrafficLight(object):
     """A traffic light that switches periodically."""
 
     valid_states = [True, False]  # True = NS open, False = EW open
 
-    def __init__(self, state=None, period=None):
-        self.state = state if state is not None else random.choice(self.valid_states)
-        self.period = period if period is not None else random.choice([3, 4, 5])
+    __slots__ = ['state', 'period', 'last_updated']  # there is one per intersection, keep them small
+
+    def __init__(self, state=None, period=None, rng=random, periods=(3, 4, 5)):
+        self.state = state if state is not None else rng.choice(self.valid_states)
+        self.period = period if period is not None else rng.choice(periods)  # random period drawn from periods
         self.last_updated = 0
 
     def reset(self):
@@ -19,8 +23,48 @@ class TrafficLight(object):
 
     def update(self, t):
         if t - self.last_updated >= self.period:
-            self.state = not self.state  # assuming state is boolean
-            self.last_updated = t
+            self.switch(t)
+
+    def switch(self, t):
+        self.state = not self.state  # assuming state is boolean
+        self.last_updated = t
+
+
+HEADINGS = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # ENWS
+
+# Light color seen when arriving with a heading: (light state, heading) -> 'green' or 'red'
+LIGHT_COLORS = dict(((state, heading), 'green' if (state and heading[1] != 0) or (not state and heading[0] != 0) else 'red')
+                    for state in TrafficLight.valid_states for heading in HEADINGS)
+
+HEADING_CODES = dict((heading, i) for i, heading in enumerate(HEADINGS))
+
+# Heading after turning: heading -> new heading
+LEFT_TURNS = dict((heading, (heading[1], -heading[0])) for heading in HEADINGS)
+RIGHT_TURNS = dict((heading, (-heading[1], heading[0])) for heading in HEADINGS)
+
+
+class AgentState(object):
+    """Location, heading and trip of one agent; updated in place as the agent moves.
+
+    Also readable and writable like the dict it replaces, e.g. state['location'].
+    """
+
+    __slots__ = ['location', 'heading', 'destination', 'deadline']
+
+    def __init__(self, location, heading, destination=None, deadline=None):
+        self.location = location
+        self.heading = heading
+        self.destination = destination
+        self.deadline = deadline
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
 
 
 class Environment(object):
@@ -28,119 +72,209 @@ class Environment(object):
 
     valid_actions = [None, 'forward', 'left', 'right']
     valid_inputs = {'light': TrafficLight.valid_states, 'oncoming': valid_actions, 'left': valid_actions, 'right': valid_actions}
-    valid_headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # ENWS
-
-    def __init__(self):
+    valid_headings = HEADINGS  # ENWS
+
+    def __init__(self, seed=None, telemetry=None, grid_size=(8, 6), num_dummies=3, traffic_density=None,
+                 light_periods=(3, 4, 5), min_route_dist=4, deadline_factor=5, batched_traffic=False):
+        """Create a world of grid_size (cols, rows) intersections with num_dummies dummy agents.
+
+        traffic_density, if given, sets the number of dummy agents per intersection instead of num_dummies.
+        With batched_traffic, the dummy traffic is a TrafficController instead of DummyAgents (much faster with
+        many cars, but its cars move simultaneously, see traffic.py).
+        Traffic light periods are drawn from light_periods. Each trial's start and destination are at least
+        min_route_dist apart (L1), and the deadline is deadline_factor times their distance.
+        """
+        self.random = random.Random(seed)  # all randomness in this world (lights, trips, agents) is drawn from here
+        self.telemetry = telemetry if telemetry is not None else Telemetry()  # records and console messages
         self.done = False
         self.t = 0
-        self.agent_states = OrderedDict()
+        self.agent_states = OrderedDict()  # agent -> AgentState
+        self.agent_order = {}  # agent -> creation index
+        self.occupancy = {}  # location -> sorted list of (creation index, agent) at that intersection; kept up to date on every move
         self.status_text = ""
         self.success = False  # primary agent completed objective (self.success = True) or not (self.success = False)
+        self.traffic = None  # TrafficController, with batched_traffic
+
+        # Trip rules
+        self.min_route_dist = min_route_dist
+        self.deadline_factor = deadline_factor
+        if min_route_dist > grid_size[0] + grid_size[1] - 2:
+            raise ValueError("min_route_dist = {} is larger than any distance on a {} grid".format(min_route_dist, grid_size))
 
         # Road network
-        self.grid_size = (8, 6)  # (cols, rows)
+        self.grid_size = grid_size  # (cols, rows)
         self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
         self.block_size = 100
         self.intersections = OrderedDict()
         self.roads = []
         for x in xrange(self.bounds[0], self.bounds[2] + 1):
             for y in xrange(self.bounds[1], self.bounds[3] + 1):
-                self.intersections[(x, y)] = TrafficLight()  # a traffic light at each intersection
+                self.intersections[(x, y)] = TrafficLight(rng=self.random, periods=light_periods)  # a traffic light at each intersection
+        self.locations = self.intersections.keys()  # for picking random locations
+        self.light_schedule = {}  # time -> groups of traffic lights (same period) that switch then, see reset_lights()
+        self.reset_lights()
 
         for a in self.intersections:
-            for b in self.intersections:
-                if a == b:
-                    continue
-                if (abs(a[0] - b[0]) + abs(a[1] - b[1])) == 1:  # L1 distance = 1
+            for b in ((a[0] - 1, a[1]), (a[0], a[1] - 1), (a[0], a[1] + 1), (a[0] + 1, a[1])):  # neighbours at L1 distance = 1
+                if b in self.intersections:
                     self.roads.append((a, b))
 
+        # Next intersection in each heading, wrapping around at the edges: location -> next locations (by heading code)
+        cols, rows = self.bounds[2] - self.bounds[0] + 1, self.bounds[3] - self.bounds[1] + 1
+        self.neighbours = {}
+        for location in self.locations:
+            self.neighbours[location] = tuple(self.locations[((location[0] + heading[0] - self.bounds[0]) % cols) * rows + (location[1] + heading[1] - self.bounds[1]) % rows]
+                                              for heading in self.valid_headings)  # same tuples as the intersection keys
+
         # Dummy agents
-        self.num_dummies = 3  # no. of dummy agents
-        for i in xrange(self.num_dummies):
-            self.create_agent(DummyAgent)
+        self.num_dummies = num_dummies if traffic_density is None else int(round(traffic_density * len(self.intersections)))  # no. of dummy agents
+        if batched_traffic:
+            from traffic import TrafficController  # needs numpy
+            self.traffic = TrafficController(self, self.num_dummies)
+        else:
+            for i in xrange(self.num_dummies):
+                self.create_agent(DummyAgent)
 
         # Primary agent
         self.primary_agent = None  # to be set explicitly
         self.enforce_deadline = False
 
+        self.profiler = None  # see set_profiler()
+        self.recorder = None  # if set, receives the setup and all actions of every trial (see replay.TrialRecorder)
+
     def create_agent(self, agent_class, *args, **kwargs):
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'location': random.choice(self.intersections.keys()), 'heading': (0, 1)}
+        self.agent_order[agent] = len(self.agent_order)
+        self.agent_states[agent] = AgentState(self.random.choice(self.locations), (0, 1))
+        self.add_occupant(agent, self.agent_states[agent].location)
         return agent
 
     def set_primary_agent(self, agent, enforce_deadline=False):
         self.primary_agent = agent
         self.enforce_deadline = enforce_deadline
 
+    def set_profiler(self, profiler):
+        """Collect phase timings (lights, update of each agent class, sense, act, learn) in profiler."""
+        self.profiler = profiler
+        profiler.instrument(self, 'sense')
+        profiler.instrument(self, 'act')
+
     def reset(self):
         self.done = False
         self.t = 0
         self.success = False
 
-        # Reset traffic lights
-        for traffic_light in self.intersections.itervalues():
-            traffic_light.reset()
+        self.reset_lights()
 
         # Pick a start and a destination
-        start = random.choice(self.intersections.keys())
-        destination = random.choice(self.intersections.keys())
+        start = self.random.choice(self.locations)
+        destination = self.random.choice(self.locations)
 
         # Ensure starting location and destination are not too close
-        while self.compute_dist(start, destination) < 4:
-            start = random.choice(self.intersections.keys())
-            destination = random.choice(self.intersections.keys())
+        while self.compute_dist(start, destination) < self.min_route_dist:
+            start = self.random.choice(self.locations)
+            destination = self.random.choice(self.locations)
 
-        start_heading = random.choice(self.valid_headings)
-        deadline = self.compute_dist(start, destination) * 5
-        print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
+        start_heading = self.random.choice(self.valid_headings)
+        deadline = self.compute_dist(start, destination) * self.deadline_factor
+        self.telemetry.log(TRIALS, "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline))
 
         # Initialize agent(s)
+        self.occupancy = {}
         for agent in self.agent_states.iterkeys():
-            self.agent_states[agent] = {
-                'location': start if agent is self.primary_agent else random.choice(self.intersections.keys()),
-                'heading': start_heading if agent is self.primary_agent else random.choice(self.valid_headings),
-                'destination': destination if agent is self.primary_agent else None,
-                'deadline': deadline if agent is self.primary_agent else None}
+            if agent is self.primary_agent:
+                self.place_agent(agent, start, start_heading, destination, deadline)
+            else:
+                self.place_agent(agent, self.random.choice(self.locations), self.random.choice(self.valid_headings))
             agent.reset(destination=(destination if agent is self.primary_agent else None))
+        if self.traffic is not None:
+            self.traffic.reset()
+
+        if self.recorder is not None:
+            self.recorder.begin_trial(self)
+
+    def reset_lights(self):
+        """Restart all traffic light periods at t = 0 and schedule their first switch (also after changing periods).
+
+        Lights with the same period switch at the same ticks, so they are scheduled together as one group.
+        """
+        groups = OrderedDict()  # period -> traffic lights
+        for traffic_light in self.intersections.itervalues():
+            traffic_light.reset()
+            groups.setdefault(traffic_light.period, []).append(traffic_light)
+        self.light_schedule = {}
+        for period, group in groups.iteritems():
+            self.light_schedule.setdefault(period, []).append(group)
+        if self.traffic is not None:
+            self.traffic.reset_lights()
 
     def step(self):
         #print "Environment.step(): t = {}".format(self.t)  # [debug]
 
-        # Update traffic lights
-        for intersection, traffic_light in self.intersections.iteritems():
-            traffic_light.update(self.t)
+        profiler = self.profiler
+        if profiler is not None:
+            start = timer()
+
+        # Update traffic lights: only the ones due to switch now (same as calling update(t) on every light)
+        groups = self.light_schedule.pop(self.t, None)
+        if groups is not None:
+            for group in groups:
+                for traffic_light in group:
+                    traffic_light.switch(self.t)
+                self.light_schedule.setdefault(self.t + group[0].period, []).append(group)
+
+        if profiler is not None:
+            profiler.add('lights', timer() - start)
+
+        # Update batched dummy traffic (before all agents, like dummy agents)
+        if self.traffic is not None:
+            if profiler is not None:
+                start = timer()
+            self.traffic.step(self.t)
+            if profiler is not None:
+                profiler.add('traffic', timer() - start)
 
         # Update agents
-        for agent in self.agent_states.iterkeys():
-            agent.update(self.t)
+        if profiler is None:
+            for agent in self.agent_states.iterkeys():
+                agent.update(self.t)
+        else:
+            for agent in self.agent_states.iterkeys():
+                start = timer()
+                agent.update(self.t)
+                profiler.add('update[{}]'.format(agent.__class__.__name__), timer() - start)
 
         self.t += 1
         if self.primary_agent is not None:
-            if self.enforce_deadline and self.agent_states[self.primary_agent]['deadline'] <= 0:
+            state = self.agent_states[self.primary_agent]
+            if self.enforce_deadline and state.deadline <= 0:
                 self.done = True
-                print "Environment.reset(): Primary agent could not reach destination within deadline!"
-            self.agent_states[self.primary_agent]['deadline'] -= 1
+                self.telemetry.log(TRIALS, "Environment.reset(): Primary agent could not reach destination within deadline!")
+            state.deadline -= 1
 
     def sense(self, agent):
         assert agent in self.agent_states, "Unknown agent!"
 
         state = self.agent_states[agent]
-        location = state['location']
-        heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        location = state.location
+        heading = state.heading
+        light = LIGHT_COLORS[self.intersections[location].state, heading]
 
-        # Populate oncoming, left, right
+        # Populate oncoming, left, right (only agents at the same intersection: batched cars first, then agents in creation order)
         oncoming = None
         left = None
         right = None
-        for other_agent, other_state in self.agent_states.iteritems():
-            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
+        if self.traffic is not None:
+            oncoming, left, right = self.traffic.sense(location, heading)
+        for _, other_agent in self.occupancy[location]:
+            other_state_heading = self.agent_states[other_agent].heading
+            if agent == other_agent or (heading[0] == other_state_heading[0] and heading[1] == other_state_heading[1]):
                 continue
             other_heading = other_agent.get_next_waypoint()
-            if (heading[0] * other_state['heading'][0] + heading[1] * other_state['heading'][1]) == -1:
+            if (heading[0] * other_state_heading[0] + heading[1] * other_state_heading[1]) == -1:
                 if oncoming != 'left':  # we don't want to override oncoming == 'left'
                     oncoming = other_heading
-            elif (heading[1] == other_state['heading'][0] and -heading[0] == other_state['heading'][1]):
+            elif (heading[1] == other_state_heading[0] and -heading[0] == other_state_heading[1]):
                 if right != 'forward' and right != 'left':  # we don't want to override right == 'forward or 'left'
                     right = other_heading
             else:
@@ -150,16 +284,18 @@ class Environment(object):
         return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}  # TODO: make this a namedtuple
 
     def get_deadline(self, agent):
-        return self.agent_states[agent]['deadline'] if agent is self.primary_agent else None
+        return self.agent_states[agent].deadline if agent is self.primary_agent else None
 
     def act(self, agent, action):
         assert agent in self.agent_states, "Unknown agent!"
         assert action in self.valid_actions, "Invalid action!"
+        if self.recorder is not None:
+            self.recorder.record_action(agent, action)
 
         state = self.agent_states[agent]
-        location = state['location']
-        heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        location = state.location
+        heading = state.heading
+        light = LIGHT_COLORS[self.intersections[location].state, heading]
 
         # Move agent if within bounds and obeys traffic rules
         reward = 0  # reward/penalty
@@ -169,19 +305,20 @@ class Environment(object):
                 move_okay = False
         elif action == 'left':
             if light == 'green':
-                heading = (heading[1], -heading[0])
+                heading = LEFT_TURNS[heading]
             else:
                 move_okay = False
         elif action == 'right':
-            heading = (-heading[1], heading[0])
+            heading = RIGHT_TURNS[heading]
 
         if action is not None:
             if move_okay:
-                location = ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
-                            (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
+                location = self.neighbours[location][HEADING_CODES[heading]]  # wrap-around
                 #if self.bounds[0] <= location[0] <= self.bounds[2] and self.bounds[1] <= location[1] <= self.bounds[3]:  # bounded
-                state['location'] = location
-                state['heading'] = heading
+                self.remove_occupant(agent, state.location)
+                self.add_occupant(agent, location)
+                state.location = location
+                state.heading = heading
                 reward = 2 if action == agent.get_next_waypoint() else 0.5
             else:
                 reward = -1
@@ -189,17 +326,38 @@ class Environment(object):
             reward = 1
 
         if agent is self.primary_agent:
-            if state['location'] == state['destination']:
-                if state['deadline'] >= 0:
+            if state.location == state.destination:
+                if state.deadline >= 0:
                     reward += 10  # bonus
                 self.done = True
                 self.success = True
-                print "Environment.act(): Primary agent has reached destination!"  # [debug]
+                self.telemetry.log(TRIALS, "Environment.act(): Primary agent has reached destination!")  # [debug]
             self.status_text = "state: {}\naction: {}\nreward: {}".format(agent.get_state(), action, reward)
             #print "Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward)  # [debug]
 
         return reward
 
+    def place_agent(self, agent, location, heading, destination=None, deadline=None):
+        """Put agent at location with heading (and the primary agent's trip), keeping the occupancy index in sync."""
+        state = self.agent_states[agent]
+        if (self.agent_order[agent], agent) in self.occupancy.get(state.location, ()):
+            self.remove_occupant(agent, state.location)
+        state.location = location
+        state.heading = heading
+        state.destination = destination
+        state.deadline = deadline
+        self.add_occupant(agent, location)
+
+    def add_occupant(self, agent, location):
+        """Add agent to the occupancy index at location (call remove_occupant first when moving it)."""
+        bisect.insort(self.occupancy.setdefault(location, []), (self.agent_order[agent], agent))
+
+    def remove_occupant(self, agent, location):
+        occupants = self.occupancy[location]
+        occupants.remove((self.agent_order[agent], agent))
+        if not occupants:
+            del self.occupancy[location]
+
     def compute_dist(self, a, b):
         """L1 distance between two points."""
         return abs(b[0] - a[0]) + abs(b[1] - a[1])
@@ -232,8 +390,8 @@ class DummyAgent(Agent):
 
     def __init__(self, env):
         super(DummyAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
-        self.next_waypoint = random.choice(Environment.valid_actions[1:])
-        self.color = random.choice(self.color_choices)
+        self.next_waypoint = self.env.random.choice(Environment.valid_actions[1:])
+        self.color = self.env.random.choice(self.color_choices)
 
     def update(self, t):
         inputs = self.env.sense(self)
@@ -252,7 +410,7 @@ class DummyAgent(Agent):
         action = None
         if action_okay:
             action = self.next_waypoint
-            self.next_waypoint = random.choice(Environment.valid_actions[1:])
+            self.next_waypoint = self.env.random.choice(Environment.valid_actions[1:])
         reward = self.env.act(self, action)
         #print "DummyAgent.update(): t = {}, inputs = {}, action = {}, reward = {}".format(t, inputs, action, reward)  # [debug]
         #print "DummyAgent.update(): next_waypoint = {}".format(self.next_waypoint)  # [debug]
@@ -0,0 +1,101 @@
+import math
+import multiprocessing
+import numpy as np
+
+import agent
+from batch_environment import BatchEnvironment
+from qtable import encode_states
+from telemetry import Telemetry, SILENT
+
+# Two-sided 95% critical values of Student's t distribution, by degrees of freedom
+T_95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+        2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+class Evaluation(object):
+    """Scores of one configuration over several seeds, with per-trial outcomes (arrays of shape (seeds, trials)).
+
+    A run can end before n_trials (e.g. with a stopping_rule in the config); the trials it did not run are masked
+    in the per-trial arrays (numpy masked arrays, so success.mean() and the like only count trials that ran), and
+    trials_run holds the number of trials of each seed.
+    """
+
+    def __init__(self, config, seeds, scores, success, steps, net_reward, penalties, trials_run):
+        self.config = config
+        self.seeds = seeds
+        self.scores = scores
+        self.success = success
+        self.steps = steps
+        self.net_reward = net_reward
+        self.penalties = penalties
+        self.trials_run = trials_run
+
+        k = len(scores)
+        self.mean = scores.mean()
+        self.var = scores.var(ddof=1) if k > 1 else 0.  # sample variance
+        half_width = (T_95[k - 1] if k - 1 < len(T_95) else 1.96) * math.sqrt(self.var / k) if k > 1 else float('inf')
+        self.ci = (self.mean - half_width, self.mean + half_width)  # 95% confidence interval of the mean score
+
+    def __repr__(self):
+        return 'Evaluation(mean = %.4f, 95%% CI = [%.4f, %.4f], %i seeds)' % (self.mean, self.ci[0], self.ci[1], len(self.seeds))
+
+
+def run_seed(job):
+    """Train a LearningAgent with one seed; return its score and the per-trial records (runs in a worker process)."""
+    config, seed, n_trials, env_options = job
+    telemetry = Telemetry(SILENT)
+    score = agent.run(headless=True, n_trials=n_trials, seed=seed, telemetry=telemetry, env_options=env_options, **config)
+    return score, telemetry.trial_records()
+
+
+def evaluate(config=None, seeds=range(10), n_trials=100, processes=None, env_options=None):
+    """Train and score a LearningAgent configuration (its keyword arguments) once per seed, in parallel.
+
+    processes = None uses all cores, processes = 1 runs in this process.
+    """
+    config = config if config is not None else {}
+    seeds = list(seeds)
+    jobs = [(config, seed, n_trials, env_options if env_options is not None else {}) for seed in seeds]
+    if processes == 1:
+        results = map(run_seed, jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(run_seed, jobs)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    # Trial records of all seeds have the same length unless a run stopped early; mask the trials that did not run
+    records = np.zeros((len(seeds), n_trials), dtype=results[0][1].dtype)
+    not_run = np.ones((len(seeds), n_trials), dtype=bool)
+    for i, (score, trials) in enumerate(results):
+        records[i, :len(trials)] = trials
+        not_run[i, :len(trials)] = False
+    masked = lambda field: np.ma.array(records[field], mask=not_run)
+    return Evaluation(config, seeds, np.array([score for score, trials in results]), masked('success').astype(bool),
+                      masked('steps'), masked('net_reward'), masked('penalties'), n_trials - not_run.sum(axis=1))
+
+
+def evaluate_policy(policy, n_trials=1000, n_worlds=1000, seed=None, env_options=None):
+    """Success rate and mean steps of a frozen policy (qtable.greedy_policy codes) over n_trials trials.
+
+    All trials run side by side in a BatchEnvironment, with the policy applied as a single array lookup per tick.
+    env_options are the same as for evaluate() (see Environment).
+    """
+    env = BatchEnvironment(n_worlds, seed=seed, **(env_options if env_options is not None else {}))
+    policy = np.asarray(policy)
+
+    def act(inputs):
+        return policy[encode_states(inputs['waypoint'], inputs['light'], inputs['oncoming'], inputs['left'])]
+
+    successes = 0
+    steps = 0
+    for start in xrange(0, n_trials, n_worlds):
+        n = min(n_worlds, n_trials - start)
+        env.reset(np.arange(n_worlds) < n)  # the remaining worlds stay done
+        while not env.done.all():
+            env.step(act)
+        successes += env.success[:n].sum()
+        steps += env.t[:n].sum()
+    return float(successes) / n_trials, float(steps) / n_trials
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class ExperienceBuffer(object):
+    """Fixed-capacity ring buffer of transitions (state code, action code, reward, next state code, terminal).
+
+    Once full, new transitions overwrite the oldest ones. add() only appends to a list, which is written into the
+    arrays all at once by the next sample(), so that storing a step costs the acting loop next to nothing.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.state = np.zeros(capacity, dtype=np.int16)
+        self.action = np.zeros(capacity, dtype=np.int8)
+        self.reward = np.zeros(capacity)
+        self.next_state = np.zeros(capacity, dtype=np.int16)
+        self.terminal = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.position = 0  # where the next transition goes
+        self.staged = []  # transitions added since the last flush()
+
+    def __len__(self):
+        return min(self.size + len(self.staged), self.capacity)
+
+    def add(self, state, action, reward, next_state, terminal=False):
+        self.staged.append((state, action, reward, next_state, terminal))
+
+    def flush(self):
+        """Write the staged transitions into the arrays."""
+        n = len(self.staged)
+        if n == 0:
+            return
+        staged = self.staged[-self.capacity:]  # the others would be overwritten anyway
+        self.staged = []
+        i = (self.position + n - len(staged) + np.arange(len(staged))) % self.capacity
+        self.state[i], self.action[i], self.reward[i], self.next_state[i], self.terminal[i] = zip(*staged)
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, rng, batch_size):
+        """Return (state, action, reward, next_state, terminal) arrays of batch_size transitions drawn uniformly
+        (with replacement) with rng, a np.random.RandomState; batch_size = None returns all transitions."""
+        self.flush()
+        if batch_size is None:
+            i = slice(0, self.size)
+        else:
+            i = rng.randint(0, self.size, size=batch_size)
+        return self.state[i], self.action[i], self.reward[i], self.next_state[i], self.terminal[i]
+
+
+def q_update(values, batch, alpha, gamma):
+    """Apply the Q-learning update to values (a C-contiguous Q-table array) for a batch of transitions at once.
+
+    Targets bootstrap from the next state, all from the values before the update; an entry that appears several
+    times in the batch moves towards the mean of its targets (as one update with learning rate alpha).
+    """
+    state, action, reward, next_state, terminal = batch
+    n_actions = values.shape[1]
+    target = reward + gamma * np.where(terminal, 0., values.max(axis=1)[next_state])
+
+    flat = values.reshape(-1)  # a view, updated in place
+    entry = state * n_actions + action.astype(int)
+    count = np.bincount(entry, minlength=flat.size)
+    error = np.bincount(entry, weights=target - flat[entry], minlength=flat.size)
+    flat += alpha * error / np.maximum(count, 1)  # entries not in the batch have no error and stay as they are
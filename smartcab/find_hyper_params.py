@@ -1,30 +1,41 @@
-import agent
+import argparse
+
+import scoring
+import sweep
 
 if __name__ == '__main__':
-	# Perform exhaustive search over all paramter combinations
-	# Save parameters and scores into csv file for easy sorting and plotting
+	# Search over paramter combinations on all cores
+	# Each result is appended to hyper_params.csv as soon as it finishes; re-running skips results already in the file
+	parser = argparse.ArgumentParser(description='Smartcab hyper-parameter search')
+	parser.add_argument('--search', choices=['grid', 'random', 'halving'], default='grid')
+	parser.add_argument('--samples', type=int, default=81, help='number of configurations for random/halving search')
+	parser.add_argument('--seeds', type=int, default=1, help='number of random seeds per configuration')
+	parser.add_argument('--trials', type=int, default=100, help='number of trials per run (maximum for halving search)')
+	parser.add_argument('--processes', type=int, default=None, help='worker processes (default: all cores)')
+	parser.add_argument('--out', default='hyper_params.csv')
+	parser.add_argument('--early-stop', action='store_true', help='stop runs early once they clearly converged or clearly fail (scores are then projected)')
+	args = parser.parse_args()
 
 	# Declare parameter ranges to search over
-	sigmoid_offset_range = [4., 6., 8.]
-	sigmoid_rate_range   = [10**i for i in range(-3, 0)]
-	alpha_decay_range    = [0.1, 0.5, 0.9]
-	gamma_range          = [0.1, 0.5, 0.9]
-
-	csv_string = 'sigmoid_offset,sigmoid_rate,alpha_decay,gamma,score\n'
-	score = -1.
-
-	# Sweep over all paramter combinations
-	for sigmoid_offset in sigmoid_offset_range:
-		for sigmoid_rate in sigmoid_rate_range:
-			for alpha_decay in alpha_decay_range:
-				for gamma in gamma_range:
-					# Run trials with given parameter combination
-					score = agent.run(sigmoid_offset=sigmoid_offset, sigmoid_rate=sigmoid_rate, alpha_decay=alpha_decay, gamma=gamma)
+	grid_space = {
+		'sigmoid_offset': [4., 6., 8.],
+		'sigmoid_rate':   [10**i for i in range(-3, 0)],
+		'alpha_decay':    [0.1, 0.5, 0.9],
+		'gamma':          [0.1, 0.5, 0.9]}
+	random_space = {
+		'sigmoid_offset': (4., 8.),
+		'sigmoid_rate':   [10**(i/4.) for i in range(-12, -3)],  # log scale
+		'alpha_decay':    (0.1, 0.9),
+		'gamma':          (0.1, 0.9)}
 
-					csv_string += '%f,%f,%f,%f,%.4f\n' % (sigmoid_offset,sigmoid_rate,alpha_decay,gamma,score)
-					print 'Hyper-parameter search status: %f,%f,%f,%f,%.4f' % (sigmoid_offset,sigmoid_rate,alpha_decay,gamma,score)  # [debug]
+	stopping_rule = scoring.FirstOf(scoring.Failing(), scoring.Converged()) if args.early_stop else None
+	s = sweep.Sweep(args.out, seeds=range(args.seeds), processes=args.processes, stopping_rule=stopping_rule)
+	if args.search == 'grid':
+		scores = s.run(sweep.grid_configs(grid_space), args.trials)
+	elif args.search == 'random':
+		scores = s.run(sweep.random_configs(random_space, args.samples, seed=0), args.trials)
+	else:
+		scores = s.successive_halving(sweep.random_configs(random_space, args.samples, seed=0), max_trials=args.trials)
 
-	# Write results to hyper_params.csv
-	fo = open('hyper_params.csv', 'wb')
-	fo.write(csv_string);
-	fo.close()
+	best = max(scores, key=scores.get)
+	print 'Best parameters (%s): %s, score = %.4f' % (','.join(sweep.PARAMS), ','.join(best), scores[best])
@@ -0,0 +1,80 @@
+from scoring import ScoreTracker
+from telemetry import SUMMARY, TRIALS
+
+
+class HeadlessSimulator(object):
+    """Render-free simulator that steps the environment as fast as the CPU allows."""
+
+    def __init__(self, env, checkpoint_path=None, checkpoint_every=10, stopping_rule=None, tracker=None):
+        self.env = env
+        self.quit = False
+        self.checkpoint_path = checkpoint_path  # if set, save the primary agent's checkpoint here periodically
+        self.checkpoint_every = checkpoint_every  # trials between checkpoints (0 or None: only at the end of the run)
+        self.tracker = tracker if tracker is not None else ScoreTracker()  # rolling statistics and score of the run
+        self.stopping_rule = stopping_rule  # if set, may end the run early (see scoring.py)
+
+    def run(self, n_trials=1):
+        self.start_run(n_trials)
+        for trial in xrange(n_trials):
+            self.start_trial(trial)
+            try:
+                while not self.env.done:
+                    self.env.step()
+            except KeyboardInterrupt:
+                self.quit = True
+            finally:
+                self.end_trial(trial, n_trials)
+
+            if self.quit:
+                break
+
+        self.save_checkpoint()
+        return self.get_score(n_trials)
+
+    def start_run(self, n_trials):
+        self.quit = False
+        self.tracker.start(n_trials)
+
+    def start_trial(self, trial):
+        self.env.telemetry.trial = trial
+        self.env.telemetry.log(TRIALS, "{}.run(): Trial {}".format(self.__class__.__name__, trial))  # [debug]
+        self.env.reset()
+
+    def end_trial(self, trial, n_trials):
+        primary_agent = self.env.primary_agent
+        penalties = getattr(primary_agent, 'penalties', 0)
+        self.env.telemetry.record_trial(self.env.success, self.env.t, getattr(primary_agent, 'net_reward', 0), penalties)
+
+        if self.env.recorder is not None:
+            self.env.recorder.end_trial(self.env)
+
+        if self.checkpoint_path is not None and self.checkpoint_every and (trial + 1) % self.checkpoint_every == 0:
+            self.save_checkpoint()
+
+        # Keep track of score, and stop early if the stopping rule says the outcome is settled
+        tracker = self.tracker
+        tracker.record(self.env.success, self.env.t, penalties)
+        if self.env.telemetry.verbosity >= TRIALS:
+            self.env.telemetry.log(TRIALS, "Success rate = %.2f, steps to destination = %s, penalties per step = %.3f (last %i trials)" % (
+                tracker.success_rate, '%.1f' % tracker.mean_steps if tracker.mean_steps is not None else '-', tracker.penalty_rate, len(tracker.recent)))  # [debug]
+        if self.stopping_rule is not None and not self.quit and trial + 1 < n_trials:
+            tracker.stop_reason = self.stopping_rule(tracker)
+            if tracker.stop_reason is not None:
+                self.env.telemetry.log(SUMMARY, "Stopped after trial {}: {}".format(trial, tracker.stop_reason))
+                self.quit = True
+
+    def save_checkpoint(self):
+        if self.checkpoint_path is not None and hasattr(self.env.primary_agent, 'save_checkpoint'):
+            self.env.primary_agent.save_checkpoint(self.checkpoint_path)
+
+    def get_score(self, n_trials):
+        # The "score" is defined as follows:
+        # For the final 30% of trials (e.g. last 30 trials in 100-trial run), score = # of successful trials / (n_trials*0.3)
+        # If a stopping rule ended the run, the trials not run count at the rolling success rate (see ScoreTracker)
+        score = self.tracker.score()
+        self.env.telemetry.log(SUMMARY, '%i successful trials in final %i trials' % (self.tracker.num_success, 0.3*n_trials))
+        self.env.telemetry.log(SUMMARY, 'Score = %.4f%s' % (score, ' (projected)' if self.tracker.stop_reason is not None else ''))
+        if self.env.profiler is not None:
+            self.env.telemetry.log(SUMMARY, self.env.profiler.report())
+
+        return score
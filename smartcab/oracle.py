@@ -0,0 +1,78 @@
+import argparse
+import numpy as np
+
+from environment import Environment
+import qtable
+from qtable import N_ACTIONS, N_STATES, STATES, ACTION_INDEX, LIGHT_INDEX
+
+NONE, FORWARD, LEFT, RIGHT = [ACTION_INDEX[action] for action in Environment.valid_actions]
+
+
+def reward_table():
+    """Immediate reward of every action in every state code, by the rules of Environment.act.
+
+    Only the waypoint and the light matter: staying put earns 1, a move against the light -1, following the waypoint
+    2 and any other legal move 0.5 (the destination bonus is left out). Oncoming and left traffic never change a reward.
+    """
+    codes = np.arange(N_STATES)
+    waypoint = codes // (N_ACTIONS * N_ACTIONS * len(LIGHT_INDEX))
+    green = (codes // (N_ACTIONS * N_ACTIONS)) % len(LIGHT_INDEX) == LIGHT_INDEX['green']
+
+    rewards = np.empty((N_STATES, N_ACTIONS))
+    rewards[:, NONE] = 1.
+    for action in (FORWARD, LEFT, RIGHT):
+        legal = green if action != RIGHT else np.ones(N_STATES, dtype=bool)
+        rewards[:, action] = np.where(legal, np.where(waypoint == action, 2., 0.5), -1.)
+    return rewards
+
+
+REWARDS = reward_table()
+ORACLE_POLICY = REWARDS.argmax(axis=1).astype(np.int8)  # follow the waypoint when that is legal, otherwise stay put
+
+
+class PolicyComparison(object):
+    """Greedy policy of a Q-table against the oracle, per state code and summarized over the weighted states."""
+
+    def __init__(self, values, weights=None):
+        self.policy = qtable.greedy_policy(values)
+        self.agreement = self.policy == ORACLE_POLICY  # per state
+        self.regret = REWARDS[np.arange(N_STATES), ORACLE_POLICY] - REWARDS[np.arange(N_STATES), self.policy]  # per state
+
+        weights = np.ones(N_STATES) if weights is None else np.asarray(weights, dtype=float)
+        self.weights = weights / weights.sum()
+        self.agreement_rate = float(np.dot(self.weights, self.agreement))
+        self.mean_regret = float(np.dot(self.weights, self.regret))  # expected reward lost per step
+
+    def disagreements(self):
+        """(compressed state, greedy action, oracle action) of every weighted state where the policies differ."""
+        return [(STATES[s], Environment.valid_actions[self.policy[s]], Environment.valid_actions[ORACLE_POLICY[s]])
+                for s in np.flatnonzero(~self.agreement & (self.weights > 0))]
+
+    def __repr__(self):
+        return 'PolicyComparison(agreement = %.4f, mean regret = %.4f)' % (self.agreement_rate, self.mean_regret)
+
+
+def compare(q, weights=None):
+    """Compare a QTable's greedy policy with the oracle over its visited states (all states if none were visited).
+
+    weights (one per state code, e.g. visit counts) overrides the visited states.
+    """
+    if weights is None:
+        weights = q.visited if q.visited.any() else None
+    return PolicyComparison(q.values, weights)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare checkpointed Q-tables with the optimal policy')
+    parser.add_argument('checkpoints', nargs='+', help='checkpoint files written by LearningAgent.save_checkpoint')
+    parser.add_argument('--verbose', action='store_true', help='list the states where the policies differ')
+    args = parser.parse_args()
+
+    for path in args.checkpoints:
+        q, global_t = qtable.load_checkpoint(path, mmap_mode='r')
+        comparison = compare(q)
+        print '%s: global_t = %i, %i visited states, agreement = %.4f, mean regret = %.4f' % (
+            path, global_t, q.visited.sum(), comparison.agreement_rate, comparison.mean_regret)
+        if args.verbose:
+            for state, action, best in comparison.disagreements():
+                print '    %s: %s instead of %s' % (state, action, best)
@@ -1,4 +1,54 @@
-import random
+import numpy as np
+
+from environment import Environment
+from telemetry import TRIALS
+
+
+def compute_waypoint(delta, heading):
+    """Next waypoint for a (destination - location) delta and a heading; RoutePlanner's routing rules."""
+    if delta[0] == 0 and delta[1] == 0:
+        return None
+    elif delta[0] != 0:  # EW difference
+        if delta[0] * heading[0] > 0:  # facing correct EW direction
+            return 'forward'
+        elif delta[0] * heading[0] < 0:  # facing opposite EW direction
+            return 'right'  # long U-turn
+        elif delta[0] * heading[1] > 0:
+            return 'left'
+        else:
+            return 'right'
+    elif delta[1] != 0:  # NS difference (turn logic is slightly different)
+        if delta[1] * heading[1] > 0:  # facing correct NS direction
+            return 'forward'
+        elif delta[1] * heading[1] < 0:  # facing opposite NS direction
+            return 'right'  # long U-turn
+        elif delta[1] * heading[0] > 0:
+            return 'right'
+        else:
+            return 'left'
+
+
+# The waypoint only depends on the signs of delta and on the heading, so precompute all 3 x 3 x 4 cases
+WAYPOINTS = {}  # (sign of dx, sign of dy, heading) -> waypoint
+WAYPOINT_CODES = np.zeros((3, 3, len(Environment.valid_headings)), dtype=np.int8)  # [sign dx + 1, sign dy + 1, heading index] -> index into Environment.valid_actions
+HEADING_INDEX = np.zeros((3, 3), dtype=int)  # [heading x + 1, heading y + 1] -> index into Environment.valid_headings
+for h, heading in enumerate(Environment.valid_headings):
+    HEADING_INDEX[heading[0] + 1, heading[1] + 1] = h
+    for sx in (-1, 0, 1):
+        for sy in (-1, 0, 1):
+            WAYPOINTS[(sx, sy, heading)] = compute_waypoint((sx, sy), heading)
+            WAYPOINT_CODES[sx + 1, sy + 1, h] = Environment.valid_actions.index(WAYPOINTS[(sx, sy, heading)])
+
+
+def next_waypoints(locations, headings, destinations):
+    """Batched RoutePlanner.next_waypoint for arrays of (x, y) locations, headings and destinations.
+
+    Returns waypoint codes (indices into Environment.valid_actions) with the shape of the leading dimensions.
+    """
+    sign = np.sign(np.asarray(destinations) - locations)
+    headings = np.asarray(headings)
+    return WAYPOINT_CODES[sign[..., 0] + 1, sign[..., 1] + 1, HEADING_INDEX[headings[..., 0] + 1, headings[..., 1] + 1]]
+
 
 class RoutePlanner(object):
     """Silly route planner that is meant for a perpendicular grid network."""
@@ -9,30 +59,10 @@ class RoutePlanner(object):
         self.destination = None
 
     def route_to(self, destination=None):
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
-        print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
+        self.destination = destination if destination is not None else self.env.random.choice(self.env.locations)
+        self.env.telemetry.log(TRIALS, "RoutePlanner.route_to(): destination = {}".format(destination))  # [debug]
 
     def next_waypoint(self):
-        location = self.env.agent_states[self.agent]['location']
-        heading = self.env.agent_states[self.agent]['heading']
-        delta = (self.destination[0] - location[0], self.destination[1] - location[1])
-        if delta[0] == 0 and delta[1] == 0:
-            return None
-        elif delta[0] != 0:  # EW difference
-            if delta[0] * heading[0] > 0:  # facing correct EW direction
-                return 'forward'
-            elif delta[0] * heading[0] < 0:  # facing opposite EW direction
-                return 'right'  # long U-turn
-            elif delta[0] * heading[1] > 0:
-                return 'left'
-            else:
-                return 'right'
-        elif delta[1] != 0:  # NS difference (turn logic is slightly different)
-            if delta[1] * heading[1] > 0:  # facing correct NS direction
-                return 'forward'
-            elif delta[1] * heading[1] < 0:  # facing opposite NS direction
-                return 'right'  # long U-turn
-            elif delta[1] * heading[0] > 0:
-                return 'right'
-            else:
-                return 'left'
+        state = self.env.agent_states[self.agent]
+        location = state.location
+        return WAYPOINTS[(cmp(self.destination[0], location[0]), cmp(self.destination[1], location[1]), state.heading)]
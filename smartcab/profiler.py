@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+N_BUCKETS = 40  # histogram bucket i counts durations in [2**(i-1), 2**i) nanoseconds
+
+
+class PhaseStats(object):
+    """Counters and a log2 histogram of durations for one phase."""
+
+    __slots__ = ['count', 'total', 'max', 'histogram']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.histogram = [0] * N_BUCKETS
+
+    def percentile(self, p):
+        """Upper bound of the p-th percentile duration (from the histogram), in seconds."""
+        target = p / 100. * self.count
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if seen >= target:
+                return 2 ** i * 1e-9
+        return self.max
+
+
+class Profiler(object):
+    """Opt-in timing of simulation phases: lights, agent updates, sense, act, learning and rendering.
+
+    Instrumented code only checks whether a profiler is set, so a run without one pays close to nothing.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()  # phase name -> PhaseStats
+
+    def add(self, phase, seconds):
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.count += 1
+        stats.total += seconds
+        if seconds > stats.max:
+            stats.max = seconds
+        stats.histogram[min(int(seconds * 1e9).bit_length(), N_BUCKETS - 1)] += 1
+
+    def instrument(self, obj, name, phase=None):
+        """Time every call of method obj.name as phase (default: name), by shadowing it on the instance."""
+        method = getattr(obj, name)
+        phase = phase if phase is not None else name
+        add = self.add
+
+        def timed(*args, **kwargs):
+            start = timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                add(phase, timer() - start)
+
+        setattr(obj, name, timed)
+
+    def reset(self):
+        self.phases.clear()
+
+    def report(self):
+        """Return a table of all phases; phases nest (sense and act run inside update), so their totals overlap."""
+        lines = ['%-24s %10s %12s %10s %10s %10s' % ('phase', 'calls', 'total (ms)', 'mean (us)', 'p50 (us)', 'p99 (us)')]
+        for phase, stats in self.phases.iteritems():
+            lines.append('%-24s %10i %12.1f %10.2f %10.2f %10.2f' % (phase, stats.count, stats.total * 1e3, stats.total / stats.count * 1e6,
+                                                                      stats.percentile(50) * 1e6, stats.percentile(99) * 1e6))
+        return '\n'.join(lines)
@@ -0,0 +1,111 @@
+import itertools
+import multiprocessing
+import os
+import numpy as np
+
+from environment import Environment
+
+# Integer encoding of the compressed state (waypoint, light, oncoming, left) used by LearningAgent
+# Actions/waypoints are indices into Environment.valid_actions, lights are 0 = red, 1 = green
+ACTION_INDEX = dict((action, i) for i, action in enumerate(Environment.valid_actions))
+LIGHT_INDEX = {'red': 0, 'green': 1}
+N_ACTIONS = len(Environment.valid_actions)
+N_STATES = N_ACTIONS * len(LIGHT_INDEX) * N_ACTIONS * N_ACTIONS
+
+STATE_CODES = {}  # (waypoint, light, oncoming, left) -> state code
+STATES = [None] * N_STATES  # state code -> compressed state, as reported by LearningAgent.compress_sa
+for waypoint, light, oncoming, left in itertools.product(Environment.valid_actions, ['red', 'green'], Environment.valid_actions, Environment.valid_actions):
+    code = ((ACTION_INDEX[waypoint] * 2 + LIGHT_INDEX[light]) * N_ACTIONS + ACTION_INDEX[oncoming]) * N_ACTIONS + ACTION_INDEX[left]
+    STATE_CODES[(waypoint, light, oncoming, left)] = code
+    STATES[code] = tuple('None' if x is None else x for x in (waypoint, light, oncoming, left))
+
+# Checkpoint file layout: a single-record .npy file, so it can be memory-mapped with np.load(path, mmap_mode=...)
+CHECKPOINT_DTYPE = np.dtype([('global_t', 'f8'), ('initial_q', 'f8'),
+                             ('values', 'f8', (N_STATES, N_ACTIONS)), ('visited', 'u1', (N_STATES,))])
+
+
+def encode_states(waypoint, green, oncoming, left):
+    """Vectorized state encoding, e.g. for BatchEnvironment inputs (action codes and boolean green light)."""
+    return ((np.asarray(waypoint, dtype=int) * 2 + green) * N_ACTIONS + oncoming) * N_ACTIONS + left
+
+
+def greedy_policy(values):
+    """Action code with the highest Q-value for every state code (the first one on ties, like LearningAgent)."""
+    return values.argmax(axis=1).astype(np.int8)
+
+
+class QTable(object):
+    """Dense Q-value table indexed by (state code, action code)."""
+
+    def __init__(self, initial_q=0.):
+        self.initial_q = initial_q
+        self.values = np.full((N_STATES, N_ACTIONS), initial_q)
+        self.visited = np.zeros(N_STATES, dtype=bool)  # states the agent has seen, i.e. the keys of the dict view
+
+    def to_dict(self):
+        """Return the visited part of the table as {compressed state-action: Q-value}, like the original dict Q-table."""
+        qtable = {}
+        for code in np.flatnonzero(self.visited):
+            for a, action in enumerate(Environment.valid_actions):
+                qtable[STATES[code] + ('None' if action is None else action,)] = float(self.values[code, a])
+        return qtable
+
+    def update_from_dict(self, qtable):
+        """Load Q-values from a {compressed state-action: Q-value} dict."""
+        for sa, q in qtable.iteritems():
+            state = tuple(None if x == 'None' else x for x in sa[:4])
+            code = STATE_CODES[state]
+            self.values[code, ACTION_INDEX[None if sa[4] == 'None' else sa[4]]] = q
+            self.visited[code] = True
+
+
+class SharedQTable(QTable):
+    """QTable in shared memory, with a shared step counter (global_t).
+
+    Processes forked after it was created all read and update the same table, without locks (Hogwild-style:
+    concurrent updates of one entry or of global_t can occasionally be lost).
+    """
+
+    def __init__(self, initial_q=0.):
+        self.initial_q = initial_q
+        self.shared_values = multiprocessing.RawArray('d', N_STATES * N_ACTIONS)
+        self.shared_visited = multiprocessing.RawArray('b', N_STATES)
+        self.shared_global_t = multiprocessing.RawValue('d', 0.)
+        self.values = np.frombuffer(self.shared_values).reshape(N_STATES, N_ACTIONS)
+        self.values[:] = initial_q
+        self.visited = np.frombuffer(self.shared_visited, dtype=bool)
+
+    def load(self, qtable, global_t):
+        """Copy another table's values and a global_t in, e.g. from load_checkpoint."""
+        self.initial_q = qtable.initial_q
+        self.values[:] = qtable.values
+        self.visited[:] = qtable.visited
+        self.shared_global_t.value = global_t
+
+
+def save_checkpoint(path, qtable, global_t):
+    """Write a Q-table and the agent's global_t to path; the file is replaced atomically."""
+    record = np.zeros(1, dtype=CHECKPOINT_DTYPE)
+    record['global_t'] = global_t
+    record['initial_q'] = qtable.initial_q
+    record['values'] = qtable.values
+    record['visited'] = qtable.visited
+    with open(path + '.tmp', 'wb') as fo:
+        np.save(fo, record)
+    os.rename(path + '.tmp', path)
+
+
+def load_checkpoint(path, mmap_mode=None):
+    """Return (qtable, global_t) saved by save_checkpoint.
+
+    With mmap_mode, the Q-values stay memory-mapped: 'r' for read-only inspection, 'c' (copy-on-write) to start
+    several runs from one pretrained table without copying it up front.
+    """
+    record = np.load(path, mmap_mode=mmap_mode)
+    qtable = QTable(float(record['initial_q'][0]))
+    if mmap_mode is not None:
+        qtable.values = record['values'][0]
+    else:
+        qtable.values[:] = record['values'][0]
+    qtable.visited[:] = record['visited'][0]
+    return qtable, float(record['global_t'][0])
@@ -0,0 +1,219 @@
+import argparse
+import time
+import numpy as np
+
+from environment import Agent, Environment
+from qtable import ACTION_INDEX
+from telemetry import Telemetry, SILENT
+
+
+class TrialRecorder(object):
+    """Records every trial of an Environment compactly: initial lights and agents, then each agent's actions.
+
+    Attach with env.recorder = TrialRecorder(); the environment calls begin_trial() from reset() and record_action()
+    from act(), and the simulator calls end_trial().
+    """
+
+    def __init__(self):
+        self.meta = None  # grid size, agent colors, primary agent
+        self.trials = []  # one dict of arrays per trial
+        self.actions = []  # action codes of the current trial, all agents in turn
+        self.waypoints = []  # each agent's next waypoint when it acted (it determines the reward)
+
+    def begin_trial(self, env):
+        if env.traffic is not None:
+            raise ValueError("Trials with batched_traffic cannot be recorded")
+        agents = list(env.agent_states)
+        if self.meta is None:
+            self.meta = {'grid_size': np.array(env.grid_size),
+                         'colors': np.array([agent.color for agent in agents]),
+                         'primary': np.array(agents.index(env.primary_agent) if env.primary_agent in agents else -1),
+                         'enforce_deadline': np.array(env.enforce_deadline)}
+        self.finish_trial()
+
+        primary_state = env.agent_states.get(env.primary_agent, {})
+        self.trials.append({
+            'light_state': np.array([light.state for light in env.intersections.itervalues()], dtype=bool),
+            'light_period': np.array([light.period for light in env.intersections.itervalues()], dtype=np.int8),
+            'location': np.array([env.agent_states[agent]['location'] for agent in agents], dtype=np.int16),
+            'heading': np.array([Environment.valid_headings.index(env.agent_states[agent]['heading']) for agent in agents], dtype=np.int8),
+            'destination': np.array(primary_state.get('destination') or (0, 0), dtype=np.int16),
+            'deadline': np.array(primary_state.get('deadline') or 0, dtype=np.int32),
+            'success': np.array(False), 'steps': np.array(0, dtype=np.int32)})
+
+    def record_action(self, agent, action):
+        self.actions.append(ACTION_INDEX[action])
+        self.waypoints.append(ACTION_INDEX[agent.get_next_waypoint()])
+
+    def end_trial(self, env):
+        self.trials[-1]['success'] = np.array(env.success)
+        self.trials[-1]['steps'] = np.array(env.t, dtype=np.int32)
+
+    def finish_trial(self):
+        """Move the current trial's actions into its arrays (one row per step)."""
+        if not self.trials or 'actions' in self.trials[-1]:
+            return
+        n_agents = len(self.meta['colors'])
+        n_steps = len(self.actions) // n_agents  # drop an incomplete step, e.g. after a KeyboardInterrupt
+        self.trials[-1]['actions'] = np.array(self.actions[:n_steps * n_agents], dtype=np.int8).reshape(n_steps, n_agents)
+        self.trials[-1]['waypoints'] = np.array(self.waypoints[:n_steps * n_agents], dtype=np.int8).reshape(n_steps, n_agents)
+        self.actions = []
+        self.waypoints = []
+
+    def save(self, path):
+        """Write all trials to a compressed .npz file (see load_recording)."""
+        self.finish_trial()
+        arrays = dict(self.meta)
+        for key in self.trials[0]:
+            if key not in ('actions', 'waypoints'):
+                arrays[key] = np.array([trial[key] for trial in self.trials])
+        arrays['actions'] = np.concatenate([trial['actions'] for trial in self.trials])
+        arrays['waypoints'] = np.concatenate([trial['waypoints'] for trial in self.trials])
+        arrays['step_offsets'] = np.cumsum([0] + [len(trial['actions']) for trial in self.trials])
+        np.savez_compressed(path, **arrays)
+
+
+def load_recording(path):
+    with np.load(path) as data:
+        return dict(data.items())
+
+
+class ReplayAgent(Agent):
+    """Agent that repeats recorded actions and waypoints."""
+
+    def __init__(self, env, color):
+        super(ReplayAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
+        self.color = color
+        self.actions = []
+        self.waypoints = []
+        self.step = 0
+
+    def update(self, t):
+        self.next_waypoint = Environment.valid_actions[self.waypoints[self.step]]
+        action = Environment.valid_actions[self.actions[self.step]]
+        self.step += 1
+        self.env.act(self, action)
+
+
+class Replayer(object):
+    """Rebuilds recorded trials deterministically in an Environment of ReplayAgents."""
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.env = Environment(telemetry=Telemetry(SILENT), grid_size=tuple(recording['grid_size']), num_dummies=0, min_route_dist=0)
+        self.agents = [self.env.create_agent(ReplayAgent, str(color)) for color in recording['colors']]
+        if recording['primary'] >= 0:
+            self.env.set_primary_agent(self.agents[recording['primary']], enforce_deadline=bool(recording['enforce_deadline']))
+        self.trial = None
+
+    @property
+    def n_trials(self):
+        return len(self.recording['steps'])
+
+    def load_trial(self, trial):
+        """Set the environment up as it was at the start of trial."""
+        r = self.recording
+        env = self.env
+        env.done = False
+        env.success = False
+        env.t = 0
+        env.status_text = ""
+
+        for i, traffic_light in enumerate(env.intersections.itervalues()):
+            traffic_light.state = bool(r['light_state'][trial, i])
+            traffic_light.period = int(r['light_period'][trial, i])
+        env.reset_lights()
+
+        start, end = r['step_offsets'][trial], r['step_offsets'][trial + 1]
+        for i, agent in enumerate(self.agents):
+            location = tuple(int(x) for x in r['location'][trial, i])
+            heading = Environment.valid_headings[r['heading'][trial, i]]
+            if agent is env.primary_agent:
+                env.place_agent(agent, location, heading, tuple(int(x) for x in r['destination'][trial]), int(r['deadline'][trial]))
+            else:
+                env.place_agent(agent, location, heading)
+            agent.actions = r['actions'][start:end, i]
+            agent.waypoints = r['waypoints'][start:end, i]
+            agent.step = 0
+        self.trial = trial
+
+    def finished(self):
+        return self.env.done or self.agents[0].step >= len(self.agents[0].actions)
+
+    def step(self):
+        if not self.finished():
+            self.env.step()
+
+    def seek(self, trial, step=0):
+        """Jump to a step of a trial by replaying it from the start."""
+        self.load_trial(trial)
+        while self.env.t < step and not self.finished():
+            self.env.step()
+
+    def run_trial(self, trial):
+        """Replay a whole trial headless; return (success, steps)."""
+        self.load_trial(trial)
+        while not self.finished():
+            self.env.step()
+        return self.env.success, self.env.t
+
+
+def play(recording, trial=0, fps=5.):
+    """Replay trials in the pygame window.
+
+    Keys: space = pause/resume, right/left = next/previous trial, '.'/',' = one step forward/back, Esc = quit.
+    """
+    import pygame
+    from simulator import Simulator
+
+    replayer = Replayer(recording)
+    sim = Simulator(replayer.env)
+    replayer.load_trial(trial)
+    paused = False
+    next_frame = time.time()
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == 27):  # Esc
+                return
+            elif event.type == pygame.KEYDOWN:
+                if event.unicode == u' ':
+                    paused = not paused
+                elif event.key in (pygame.K_RIGHT, pygame.K_LEFT):
+                    trial = max(0, min(replayer.n_trials - 1, trial + (1 if event.key == pygame.K_RIGHT else -1)))
+                    replayer.load_trial(trial)
+                elif event.unicode == u'.':
+                    replayer.step()
+                elif event.unicode == u',':
+                    replayer.seek(trial, replayer.env.t - 1)
+                sim.dirty = True
+
+        if not paused and time.time() >= next_frame:
+            if not replayer.finished():
+                replayer.step()
+            elif trial + 1 < replayer.n_trials:
+                trial += 1
+                replayer.load_trial(trial)
+            next_frame = time.time() + 1. / fps
+            sim.dirty = True
+
+        sim.render()
+        pygame.time.wait(sim.frame_delay)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded smartcab trials')
+    parser.add_argument('recording', help='.npz file written by agent.run(record_path=...)')
+    parser.add_argument('--trial', type=int, default=0, help='trial to start from')
+    parser.add_argument('--fps', type=float, default=5., help='steps per second in the window')
+    parser.add_argument('--headless', action='store_true', help='replay all trials without a window and check their outcome')
+    args = parser.parse_args()
+
+    recording = load_recording(args.recording)
+    if args.headless:
+        replayer = Replayer(recording)
+        for trial in xrange(args.trial, replayer.n_trials):
+            success, steps = replayer.run_trial(trial)
+            match = (success, steps) == (bool(recording['success'][trial]), int(recording['steps'][trial]))
+            print 'Trial %i: success = %s, steps = %i%s' % (trial, success, steps, '' if match else ' (differs from recording!)')
+    else:
+        play(recording, args.trial, args.fps)
@@ -0,0 +1,131 @@
+import math
+from collections import deque
+
+
+def wilson_interval(successes, n, z=1.96):
+    """Wilson score interval of a success rate (95% for z = 1.96); (0, 1) when n = 0."""
+    if n == 0:
+        return 0., 1.
+    p = float(successes) / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return center - half_width, center + half_width
+
+
+class ScoreTracker(object):
+    """Streaming scores of a run, updated after every trial.
+
+    Rolling statistics cover the last window trials; the score is the success rate over the final 30% of the
+    trials, as reported by the simulators.
+    """
+
+    def __init__(self, window=20):
+        self.window = window
+        self.start(0)
+
+    def start(self, n_trials):
+        self.n_trials = n_trials
+        self.trials = 0  # trials recorded so far
+        self.num_success = 0  # successful trials among the scored ones (final 30%)
+        self.recent = deque(maxlen=self.window)  # (success, steps, penalties) of the last trials
+        self.stop_reason = None  # set when a stopping rule ended the run
+
+    def record(self, success, steps, penalties):
+        if self.trials >= 0.7 * self.n_trials and success:
+            self.num_success += 1
+        self.trials += 1
+        self.recent.append((bool(success), steps, penalties))
+
+    @property
+    def success_rate(self):
+        return sum(success for success, steps, penalties in self.recent) / float(len(self.recent)) if self.recent else 0.
+
+    @property
+    def mean_steps(self):
+        """Mean steps to reach the destination, over the successful recent trials (None if there are none)."""
+        steps = [steps for success, steps, penalties in self.recent if success]
+        return sum(steps) / float(len(steps)) if steps else None
+
+    @property
+    def penalty_rate(self):
+        """Penalties per step over the recent trials."""
+        steps = sum(steps for success, steps, penalties in self.recent)
+        return sum(penalties for success, steps, penalties in self.recent) / float(steps) if steps else 0.
+
+    @property
+    def remaining_scored(self):
+        """Scored trials (final 30%) not run yet."""
+        return self.n_trials - max(self.trials, int(math.ceil(0.7 * self.n_trials)))
+
+    def score_bounds(self):
+        """Lowest and highest score the run can still end with."""
+        return self.num_success / (0.3 * self.n_trials), (self.num_success + self.remaining_scored) / (0.3 * self.n_trials)
+
+    def score(self):
+        """Score of the run; if a stopping rule ended it, the remaining scored trials count at the rolling success rate."""
+        if self.stop_reason is None:
+            return self.num_success / (0.3 * self.n_trials)
+        return (self.num_success + self.success_rate * self.remaining_scored) / (0.3 * self.n_trials)
+
+
+# Stopping rules: called with the ScoreTracker after every trial, they return a reason to stop the run, or None
+
+class ScoreBound(object):
+    """Stop once the score surely ends below target ('failing'), or surely reaches it ('passed'); exact."""
+
+    def __init__(self, target=0.5):
+        self.target = target
+
+    def __call__(self, tracker):
+        low, high = tracker.score_bounds()
+        if high < self.target:
+            return 'failing'
+        if low >= self.target:
+            return 'passed'
+        return None
+
+
+class Converged(object):
+    """After a fraction of the trials (after), stop once the Wilson lower bound of the rolling success rate
+    reaches target."""
+
+    def __init__(self, target=0.8, z=1.96, after=0.3):
+        self.target = target
+        self.z = z
+        self.after = after
+
+    def __call__(self, tracker):
+        if tracker.trials >= self.after * tracker.n_trials and len(tracker.recent) == tracker.window:
+            if wilson_interval(tracker.success_rate * len(tracker.recent), len(tracker.recent), self.z)[0] >= self.target:
+                return 'converged'
+        return None
+
+
+class Failing(object):
+    """After a fraction of the trials (after), stop once the Wilson upper bound of the rolling success rate
+    is below target."""
+
+    def __init__(self, target=0.5, z=1.96, after=0.5):
+        self.target = target
+        self.z = z
+        self.after = after
+
+    def __call__(self, tracker):
+        if tracker.trials >= self.after * tracker.n_trials and len(tracker.recent) == tracker.window:
+            if wilson_interval(tracker.success_rate * len(tracker.recent), len(tracker.recent), self.z)[1] < self.target:
+                return 'failing'
+        return None
+
+
+class FirstOf(object):
+    """Stop for the first of several rules that says so."""
+
+    def __init__(self, *rules):
+        self.rules = rules
+
+    def __call__(self, tracker):
+        for rule in self.rules:
+            reason = rule(tracker)
+            if reason is not None:
+                return reason
+        return None
@@ -1,11 +1,28 @@
 import os
 import time
 import random
-import pygame
 
-class Simulator(object):
+from headless import HeadlessSimulator
+from telemetry import TRIALS
+
+pygame = None  # imported by load_pygame(), so importing this module stays cheap
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'images')  # car sprites, wherever we are run from
+
+
+def load_pygame():
+    """Import pygame and initialize only what the simulator uses (display and fonts; no audio)."""
+    global pygame
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+
+
+class Simulator(HeadlessSimulator):
     """PyGame-based simulator to create a dynamic environment."""
 
+    sprites = {}  # color -> car sprite, loaded once per process
+
     colors = {
         'black'   : (  0,   0,   0),
         'white'   : (255, 255, 255),
@@ -18,8 +35,9 @@ class Simulator(object):
         'orange'  : (255, 128,   0)
     }
 
-    def __init__(self, env, size=None, frame_delay=10, update_delay=1.0):
-        self.env = env
+    def __init__(self, env, size=None, frame_delay=10, update_delay=1.0, checkpoint_path=None, checkpoint_every=10, render_fps=None,
+                 stopping_rule=None, tracker=None):
+        super(Simulator, self).__init__(env, checkpoint_path, checkpoint_every, stopping_rule, tracker)
         self.size = size if size is not None else ((self.env.grid_size[0] + 1) * self.env.block_size, (self.env.grid_size[1] + 1) * self.env.block_size)
         self.width, self.height = self.size
         self.frame_delay = frame_delay
@@ -28,34 +46,48 @@ class Simulator(object):
         self.road_width = 5
         self.road_color = self.colors['black']
 
-        self.quit = False
         self.start_time = None
         self.current_time = 0.0
         self.last_updated = 0.0
         self.update_delay = update_delay
+        self.render_fps = render_fps  # if set, step at full speed and render at most this many frames per second
+        if render_fps is not None and render_fps <= 0:
+            raise ValueError("render_fps must be positive, got {}".format(render_fps))
 
-        pygame.init()
+        load_pygame()
         self.screen = pygame.display.set_mode(self.size)
 
         self.agent_sprite_size = (32, 32)
         self.agent_circle_radius = 10  # radius of circle, when using simple representation
-        for agent in self.env.agent_states:
-            agent._sprite = pygame.transform.smoothscale(pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
-            agent._sprite_size = (agent._sprite.get_width(), agent._sprite.get_height())
+        colors = set(agent.color for agent in self.env.agent_states)
+        if self.env.traffic is not None:
+            colors.update(self.env.traffic.color)
+        for color in colors:
+            if color not in self.sprites:
+                self.sprites[color] = pygame.transform.smoothscale(pygame.image.load(os.path.join(IMAGES_DIR, "car-{}.png".format(color))), self.agent_sprite_size)
 
         self.font = pygame.font.Font(None, 28)
         self.paused = False
 
+        # Render caches (see render())
+        self.dirty = True  # environment changed since the last frame
+        self.background = None  # static road network
+        self.light_rects = {}  # intersection -> screen area of its light
+        self.light_states = {}  # intersection -> light state last drawn
+        self.dirty_rects = []  # screen areas of agents and text drawn in the last frame
+        self.sprite_cache = {}  # (color, heading) -> rotated sprite
+        self.text_cache = {}  # (text, color) -> rendered text
+
+        if self.env.profiler is not None:
+            self.env.profiler.instrument(self, 'render')
+
     def run(self, n_trials=1):
-        # Keep track of the "score", defined as follows:
-        # For the final 30% of trials (e.g. last 30 trials in 100-trial run), score = # of successful trials / (n_trials*0.3)
-        score = 0.
-        num_success = 0.
+        if self.render_fps is not None:
+            return self.run_decoupled(n_trials)
 
-        self.quit = False
+        self.start_run(n_trials)
         for trial in xrange(n_trials):
-            print "Simulator.run(): Trial {}".format(trial)  # [debug]
-            self.env.reset()
+            self.start_trial(trial)
             self.current_time = 0.0
             self.last_updated = 0.0
             self.start_time = time.time()
@@ -63,7 +95,7 @@ class Simulator(object):
             # For last 3 trials, set update_delay=1 to manually observe whether agent learned "optimal" policy
             if trial == n_trials-4:
                 self.update_delay = 1.0
-                print 'PAUSED: Final trial, update_delay=1.0. Press any key to resume.'
+                self.env.telemetry.log(TRIALS, 'PAUSED: Final trial, update_delay=1.0. Press any key to resume.')
                 self.paused = True
                 self.pause()
 
@@ -72,14 +104,7 @@ class Simulator(object):
                 #print "Simulator.run(): current_time = {:.3f}".format(self.current_time)
                 try:
                     # Handle events
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            self.quit = True
-                        elif event.type == pygame.KEYDOWN:
-                            if event.key == 27:  # Esc
-                                self.quit = True
-                            elif event.unicode == u' ':
-                                self.paused = True
+                    self.handle_events()
 
                     if self.paused:
                         self.pause()
@@ -88,6 +113,7 @@ class Simulator(object):
                     if self.current_time - self.last_updated >= self.update_delay:
                         self.env.step()
                         self.last_updated = self.current_time
+                        self.dirty = True
 
                     # Render and sleep
                     self.render()
@@ -96,83 +122,193 @@ class Simulator(object):
                     self.quit = True
                 finally:
                     if self.quit or self.env.done:
-                        # Keep track of score when applicable
-                        if trial >= 0.7 * n_trials:
-                            if self.env.success:
-                                num_success += 1
-
+                        self.end_trial(trial, n_trials)
                         break
 
             if self.quit:
                 break
 
-        score = num_success / (0.3 * n_trials)
-        print '%i successful trials in final %i trials' % (num_success, 0.3*n_trials)
-        print 'Score = %.4f' % score
+        self.save_checkpoint()
+        return self.get_score(n_trials)
 
-        return score
+    def run_decoupled(self, n_trials=1):
+        """Step the environment as fast as possible, rendering its current state at most render_fps times per second.
 
-    def render(self):
-        # Clear screen
-        self.screen.fill(self.bg_color)
+        Events (Esc/close to quit, space to pause) are handled once per frame.
+        """
+        frame_interval = 1. / self.render_fps
+        next_frame = time.time()
 
-        # Draw elements
-        # * Static elements
-        for road in self.env.roads:
-            pygame.draw.line(self.screen, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+        self.start_run(n_trials)
+        for trial in xrange(n_trials):
+            self.start_trial(trial)
+            try:
+                while not (self.env.done or self.quit):
+                    self.env.step()
+                    self.dirty = True
+
+                    now = time.time()
+                    if now >= next_frame:
+                        self.handle_events()
+                        if self.paused:
+                            self.pause()
+                        self.render()
+                        next_frame = now + frame_interval
+            except KeyboardInterrupt:
+                self.quit = True
+            finally:
+                self.end_trial(trial, n_trials)
+
+            if self.quit:
+                break
+
+        self.save_checkpoint()
+        return self.get_score(n_trials)
 
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.quit = True
+            elif event.type == pygame.KEYDOWN:
+                if event.key == 27:  # Esc
+                    self.quit = True
+                elif event.unicode == u' ':
+                    self.paused = True
+
+    def start_trial(self, trial):
+        super(Simulator, self).start_trial(trial)
+        self.dirty = True
+
+    def render(self, force=False):
+        """Draw the environment if it changed since the last frame (or if force is set).
+
+        Roads and intersections are drawn once onto a cached background; after that only the lights that switched
+        and the areas covered by agents and text (last frame and this frame) are redrawn and updated on screen.
+        """
+        if not (self.dirty or force):
+            return
+        self.dirty = False
+
+        if self.background is None or force:
+            # Full redraw
+            if self.background is None:
+                self.background = self.draw_background()
+            self.screen.blit(self.background, (0, 0))
+            for intersection, traffic_light in self.env.intersections.iteritems():
+                self.draw_light(intersection, traffic_light)
+            self.dirty_rects = self.draw_dynamic()
+            pygame.display.flip()
+            return
+
+        # Erase agents and text drawn in the last frame
+        updated_rects = list(self.dirty_rects)
+        for rect in self.dirty_rects:
+            self.screen.blit(self.background, rect, rect)
+
+        # Redraw lights that switched or were partly erased
         for intersection, traffic_light in self.env.intersections.iteritems():
-            pygame.draw.circle(self.screen, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
-            if traffic_light.state:  # North-South is open
-                pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
-            else:  # East-West is open
-                pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
-                    (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
-
-        # * Dynamic elements
+            if traffic_light.state != self.light_states[intersection] or self.light_rects[intersection].collidelist(self.dirty_rects) != -1:
+                updated_rects.append(self.draw_light(intersection, traffic_light))
+
+        self.dirty_rects = self.draw_dynamic()
+        pygame.display.update(updated_rects + self.dirty_rects)
+
+    def draw_background(self):
+        """Return a surface with the static road network."""
+        background = pygame.Surface(self.size)
+        background.fill(self.bg_color)
+        for road in self.env.roads:
+            pygame.draw.line(background, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+
+        self.light_rects = {}
+        for intersection in self.env.intersections:
+            pygame.draw.circle(background, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
+            self.light_rects[intersection] = pygame.rect.Rect(intersection[0] * self.env.block_size - 16, intersection[1] * self.env.block_size - 16, 33, 33)
+        return background
+
+    def draw_light(self, intersection, traffic_light):
+        """Draw a traffic light over its intersection (restoring the background first); return its rect."""
+        rect = self.light_rects[intersection]
+        self.screen.blit(self.background, rect, rect)
+        if traffic_light.state:  # North-South is open
+            pygame.draw.line(self.screen, self.colors['green'],
+                (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
+                (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
+        else:  # East-West is open
+            pygame.draw.line(self.screen, self.colors['green'],
+                (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
+                (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
+        self.light_states[intersection] = traffic_light.state
+        return rect
+
+    def draw_dynamic(self):
+        """Draw agents, destinations and status text; return the rects drawn."""
+        rects = []
+        if self.env.traffic is not None:
+            for location, heading, waypoint, color in self.env.traffic.cars():
+                self.draw_car(rects, location, heading, waypoint, color, self.sprites.get(color))
         for agent, state in self.env.agent_states.iteritems():
-            # Compute precise agent location here (back from the intersection some)
-            agent_offset = (2 * state['heading'][0] * self.agent_circle_radius, 2 * state['heading'][1] * self.agent_circle_radius)
-            agent_pos = (state['location'][0] * self.env.block_size - agent_offset[0], state['location'][1] * self.env.block_size - agent_offset[1])
             agent_color = self.colors[agent.color]
-            if hasattr(agent, '_sprite') and agent._sprite is not None:
-                # Draw agent sprite (image), properly rotated
-                rotated_sprite = agent._sprite if state['heading'] == (1, 0) else pygame.transform.rotate(agent._sprite, 180 if state['heading'][0] == -1 else state['heading'][1] * -90)
-                self.screen.blit(rotated_sprite,
-                    pygame.rect.Rect(agent_pos[0] - agent._sprite_size[0] / 2, agent_pos[1] - agent._sprite_size[1] / 2,
-                        agent._sprite_size[0], agent._sprite_size[1]))
-            else:
-                # Draw simple agent (circle with a short line segment poking out to indicate heading)
-                pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
-                pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width)
-            if agent.get_next_waypoint() is not None:
-                self.screen.blit(self.font.render(agent.get_next_waypoint(), True, agent_color, self.bg_color), (agent_pos[0] + 10, agent_pos[1] + 10))
+            self.draw_car(rects, state['location'], state['heading'], agent.get_next_waypoint(), agent.color, self.sprites.get(agent.color))
             if state['destination'] is not None:
-                pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6)
-                pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2)
+                rects.append(pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6))
+                rects.append(pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2))
 
         # * Overlays
         text_y = 10
         for text in self.env.status_text.split('\n'):
-            self.screen.blit(self.font.render(text, True, self.colors['red'], self.bg_color), (100, text_y))
+            rects.append(self.screen.blit(self.text(text, self.colors['red']), (100, text_y)))
             text_y += 20
+        return rects
 
-        # Flip buffers
-        pygame.display.flip()
+    def draw_car(self, rects, location, heading, waypoint, color, sprite):
+        """Draw one agent or car with its next waypoint, adding the rects drawn to rects."""
+        # Compute precise agent location here (back from the intersection some)
+        agent_offset = (2 * heading[0] * self.agent_circle_radius, 2 * heading[1] * self.agent_circle_radius)
+        agent_pos = (location[0] * self.env.block_size - agent_offset[0], location[1] * self.env.block_size - agent_offset[1])
+        agent_color = self.colors[color]
+        if sprite is not None:
+            # Draw agent sprite (image), properly rotated
+            rects.append(self.screen.blit(self.rotated_sprite(color, sprite, heading),
+                pygame.rect.Rect(agent_pos[0] - self.agent_sprite_size[0] / 2, agent_pos[1] - self.agent_sprite_size[1] / 2,
+                    self.agent_sprite_size[0], self.agent_sprite_size[1])))
+        else:
+            # Draw simple agent (circle with a short line segment poking out to indicate heading)
+            rects.append(pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius))
+            rects.append(pygame.draw.line(self.screen, agent_color, agent_pos, location, self.road_width))
+        if waypoint is not None:
+            rects.append(self.screen.blit(self.text(waypoint, agent_color), (agent_pos[0] + 10, agent_pos[1] + 10)))
+
+    def rotated_sprite(self, color, sprite, heading):
+        """Car sprite rotated to heading, cached per color and heading."""
+        key = (color, heading)
+        rotated = self.sprite_cache.get(key)
+        if rotated is None:
+            rotated = sprite if heading == (1, 0) else pygame.transform.rotate(sprite, 180 if heading[0] == -1 else heading[1] * -90)
+            self.sprite_cache[key] = rotated
+        return rotated
+
+    def text(self, text, color):
+        """Rendered text surface, cached until the text (or color) changes."""
+        key = (text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) > 1000:  # status text changes every step, don't keep all of it
+                self.text_cache.clear()
+            surface = self.text_cache[key] = self.font.render(text, True, color, self.bg_color)
+        return surface
 
     def pause(self):
         abs_pause_time = time.time()
         pause_text = "[PAUSED] Press any key to continue..."
-        self.screen.blit(self.font.render(pause_text, True, self.colors['cyan'], self.bg_color), (100, self.height - 40))
+        self.dirty_rects.append(self.screen.blit(self.font.render(pause_text, True, self.colors['cyan'], self.bg_color), (100, self.height - 40)))  # erased by the next render()
         pygame.display.flip()
-        print pause_text  # [debug]
+        self.env.telemetry.log(TRIALS, pause_text)  # [debug]
         while self.paused:
             for event in pygame.event.get():
                 if event.type == pygame.KEYDOWN:
                     self.paused = False
             pygame.time.wait(self.frame_delay)
-        self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (100, self.height - 40))
-        self.start_time += (time.time() - abs_pause_time)
+        self.dirty = True
+        if self.start_time is not None:  # the decoupled loop (render_fps) keeps no wall-clock schedule
+            self.start_time += (time.time() - abs_pause_time)
@@ -0,0 +1,134 @@
+import csv
+import itertools
+import math
+import multiprocessing
+import os
+import random
+
+import agent
+from scoring import ScoreTracker
+from telemetry import SILENT
+
+PARAMS = ['sigmoid_offset', 'sigmoid_rate', 'alpha_decay', 'gamma']
+FIELDS = PARAMS + ['seed', 'n_trials', 'score']
+
+
+def grid_configs(space):
+    """All combinations of space = {param: [values]}."""
+    return [dict(zip(PARAMS, values)) for values in itertools.product(*[space[p] for p in PARAMS])]
+
+
+def random_configs(space, n, seed=None):
+    """n random configurations; a list in space is sampled from, a (low, high) tuple uniformly."""
+    rng = random.Random(seed)
+    configs = []
+    for i in xrange(n):
+        config = {}
+        for p in PARAMS:
+            if isinstance(space[p], tuple):
+                config[p] = rng.uniform(*space[p])
+            else:
+                config[p] = rng.choice(space[p])
+        configs.append(config)
+    return configs
+
+
+def config_key(config):
+    """Parameter values as written to the csv file, so results read back match their configuration.
+
+    repr() keeps every digit of a float (random and halving configurations draw arbitrary values), and reading the
+    values back with float() gives exactly the configuration that was run.
+    """
+    return tuple(repr(float(config[p])) for p in PARAMS)
+
+
+def run_config(job):
+    """Train an agent with one (config, seed, n_trials, stopping_rule) job; runs in a worker process.
+
+    Return the job, the score and why the run stopped early (None if it ran all trials).
+    """
+    config, seed, n_trials, stopping_rule = job
+    tracker = ScoreTracker()
+    score = agent.run(headless=True, n_trials=n_trials, seed=seed, verbosity=SILENT, stopping_rule=stopping_rule, score_tracker=tracker, **config)
+    return job, score, tracker.stop_reason
+
+
+class Sweep(object):
+    """Parallel hyper-parameter search that appends each result to a csv file as soon as it finishes.
+
+    Results already in the file (same configuration, seed and n_trials) are skipped, so an interrupted sweep
+    resumes where it stopped. With a stopping_rule (see scoring.py), runs whose outcome is settled early are cut
+    short, and their projected score is recorded.
+    """
+
+    def __init__(self, path='hyper_params.csv', seeds=(0,), processes=None, stopping_rule=None):
+        self.path = path
+        self.seeds = list(seeds)
+        self.processes = processes  # None = all cores
+        self.stopping_rule = stopping_rule
+        self.results = {}  # (config_key, seed, n_trials) -> score
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as fo:
+                csv.writer(fo).writerow(FIELDS)
+            return
+
+        with open(self.path, 'rb') as fi:
+            reader = csv.reader(fi)
+            header = next(reader, [])
+            rows = [dict(zip(header, values)) for values in reader]
+
+        for row in rows:
+            if row.get('seed'):
+                key = config_key(dict((p, float(row[p])) for p in PARAMS))  # also matches files written with fewer digits
+                self.results[(key, row['seed'], row['n_trials'])] = float(row['score'])
+
+        if header != FIELDS:
+            # Older file without seed/n_trials columns: keep its rows, but they can't be matched to a job
+            with open(self.path, 'wb') as fo:
+                writer = csv.DictWriter(fo, FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(rows)
+
+    def run(self, configs, n_trials=100):
+        """Run every configuration with every seed; return {config_key: mean score over seeds}."""
+        jobs = [(config, seed, n_trials, self.stopping_rule) for config in configs for seed in self.seeds
+                if (config_key(config), str(seed), str(n_trials)) not in self.results]
+        print 'Sweep.run(): {} configurations x {} seeds, {} trials each, {} already done'.format(
+            len(configs), len(self.seeds), n_trials, len(configs) * len(self.seeds) - len(jobs))  # [debug]
+
+        if jobs:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                with open(self.path, 'ab') as fo:
+                    writer = csv.writer(fo)
+                    for (config, seed, n_trials, stopping_rule), score, stop_reason in pool.imap_unordered(run_config, jobs):
+                        key = config_key(config)
+                        self.results[(key, str(seed), str(n_trials))] = score
+                        writer.writerow(list(key) + [seed, n_trials, repr(score)])  # every digit, so a resumed sweep gets the same means
+                        fo.flush()
+                        print 'Hyper-parameter search status: %s,%i,%i,%.4f%s' % (','.join(key), seed, n_trials, score,
+                                                                                 ' (stopped early: %s)' % stop_reason if stop_reason else '')  # [debug]
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+
+        scores = {}
+        for config in configs:
+            key = config_key(config)
+            scores[key] = sum(self.results[(key, str(seed), str(n_trials))] for seed in self.seeds) / len(self.seeds)
+        return scores
+
+    def successive_halving(self, configs, min_trials=20, max_trials=100, eta=3):
+        """Run all configurations on a small budget, keep the best 1/eta and repeat with eta times more trials."""
+        n_trials = min_trials
+        while True:
+            scores = self.run(configs, n_trials)
+            if len(configs) <= 1 or n_trials >= max_trials:
+                return scores
+            configs = sorted(configs, key=lambda config: scores[config_key(config)], reverse=True)
+            configs = configs[:int(math.ceil(len(configs) / float(eta)))]
+            n_trials = min(n_trials * eta, max_trials)
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+
+# Verbosity levels: each level also prints everything of the levels below it
+SILENT = 0  # print nothing
+SUMMARY = 1  # final score of a run
+TRIALS = 2  # one or two lines per trial
+STEPS = 3  # every step of the primary agent
+
+STEP_DTYPE = np.dtype([('trial', 'i4'), ('t', 'i4'), ('state', 'i2'), ('action', 'i1'), ('reward', 'f4'), ('deadline', 'i4')])
+TRIAL_DTYPE = np.dtype([('trial', 'i4'), ('success', 'i1'), ('steps', 'i4'), ('net_reward', 'f4'), ('penalties', 'i4')])
+
+
+class Telemetry(object):
+    """Buffered per-step and per-trial records of a run, plus console messages filtered by verbosity."""
+
+    def __init__(self, verbosity=TRIALS, record_steps=False, step_capacity=4096, trial_capacity=128):
+        self.verbosity = verbosity
+        self.record_steps = record_steps  # per-step records are only collected on request
+        self.trial = 0  # current trial, set by the simulator
+
+        # Preallocated record buffers, doubled in size when full
+        self.steps = np.zeros(step_capacity, dtype=STEP_DTYPE)
+        self.trials = np.zeros(trial_capacity, dtype=TRIAL_DTYPE)
+        self.n_steps = 0
+        self.n_trials = 0
+
+    def log(self, level, message):
+        if self.verbosity >= level:
+            print message
+
+    def record_step(self, t, state, action, reward, deadline):
+        """Record one step of the primary agent (state and action codes, see qtable.py)."""
+        if self.n_steps == len(self.steps):
+            self.steps = np.resize(self.steps, 2 * len(self.steps))
+        self.steps[self.n_steps] = (self.trial, t, state, action, reward, deadline if deadline is not None else -1)
+        self.n_steps += 1
+
+    def record_trial(self, success, steps, net_reward, penalties):
+        if self.n_trials == len(self.trials):
+            self.trials = np.resize(self.trials, 2 * len(self.trials))
+        self.trials[self.n_trials] = (self.trial, success, steps, net_reward, penalties)
+        self.n_trials += 1
+
+    def step_records(self):
+        return self.steps[:self.n_steps]
+
+    def trial_records(self):
+        return self.trials[:self.n_trials]
+
+    def save(self, path):
+        """Write all records in one go: a .npz file with 'trials' and 'steps' arrays, or csv files.
+
+        For csv, trial summaries go to path and step records (if any) to <path without .csv>_steps.csv.
+        """
+        if path.endswith('.npz'):
+            np.savez_compressed(path, trials=self.trial_records(), steps=self.step_records())
+            return
+
+        base = os.path.splitext(path)[0]
+        self._save_csv(path, self.trial_records(), '%i,%i,%i,%g,%i')
+        if self.record_steps:
+            self._save_csv(base + '_steps.csv', self.step_records(), '%i,%i,%i,%i,%g,%i')
+
+    def _save_csv(self, path, records, fmt):
+        np.savetxt(path, records, fmt=fmt, delimiter=',', header=','.join(records.dtype.names), comments='')
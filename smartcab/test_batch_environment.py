@@ -0,0 +1,152 @@
+"""BatchEnvironment checked against Environment: worlds synced before each tick must see and do the same.
+
+Run from the top-level directory with: python -m unittest discover -s smartcab
+"""
+import random
+import unittest
+
+import numpy as np
+
+from batch_environment import BatchEnvironment, FORWARD, RIGHT
+from environment import Agent, Environment
+from planner import RoutePlanner
+from telemetry import Telemetry, SILENT
+
+
+class ScriptedAgent(Agent):
+    """Primary agent that follows its route planner's waypoint but takes the action it is given."""
+
+    def __init__(self, env):
+        super(ScriptedAgent, self).__init__(env)
+        self.planner = RoutePlanner(env, self)
+        self.action = None
+        self.inputs = None
+        self.reward = None
+
+    def reset(self, destination=None):
+        self.planner.route_to(destination)
+
+    def update(self, t):
+        self.next_waypoint = self.planner.next_waypoint()
+        self.inputs = self.env.sense(self)
+        self.reward = self.env.act(self, self.action)
+
+
+class FirstChoice(object):
+    """Stands in for Environment.random during a tick: choice() returns the first element, so every new dummy
+    waypoint is 'forward'."""
+
+    def choice(self, seq):
+        return seq[0]
+
+
+class FirstWaypoint(object):
+    """Stands in for BatchEnvironment.random during a tick: every new dummy waypoint is FORWARD."""
+
+    def randint(self, low, high=None, size=None):
+        return np.full(size, FORWARD, dtype=int)
+
+
+class BatchEnvironmentTest(unittest.TestCase):
+    """One BatchEnvironment world per Environment, synced before every tick, must see and do the same."""
+
+    def agents(self, env):
+        """(location, heading, next waypoint) of every agent of env, batched cars first (BatchEnvironment order)."""
+        cars = [car[:3] for car in env.traffic.cars()] if env.traffic is not None else []
+        return cars + [(state.location, state.heading, a.get_next_waypoint()) for a, state in env.agent_states.iteritems()]
+
+    def copy_world(self, batch, k, env):
+        for i, (location, heading, waypoint) in enumerate(self.agents(env)):
+            batch.location[k, i] = location
+            batch.heading[k, i] = heading
+            batch.waypoint[k, i] = Environment.valid_actions.index(waypoint)
+        for (x, y), light in env.intersections.iteritems():
+            batch.light_state[k, x - 1, y - 1] = light.state
+            batch.light_period[k, x - 1, y - 1] = light.period
+            batch.light_last_updated[k, x - 1, y - 1] = light.last_updated
+        state = env.agent_states[env.primary_agent]
+        batch.destination[k] = state.destination
+        batch.deadline[k] = state.deadline
+        batch.t[k] = env.t
+        batch.done[k] = False
+        batch.success[k] = False
+
+    def check_observe_and_act(self, batched_traffic):
+        rng = random.Random(0)
+        envs = []
+        for k in xrange(40):
+            env = Environment(seed=k, telemetry=Telemetry(SILENT), grid_size=(4, 3), num_dummies=8, batched_traffic=batched_traffic)
+            env.set_primary_agent(env.create_agent(ScriptedAgent), enforce_deadline=True)
+            env.reset()
+            envs.append(env)
+        batch = BatchEnvironment(len(envs), num_dummies=8, grid_size=(4, 3), seed=0, batched_traffic=batched_traffic)
+        batch.random = FirstWaypoint()
+
+        for tick in xrange(40):
+            for k, env in enumerate(envs):
+                if env.done:
+                    env.reset()
+                # Waypoints redrawn during a tick are all 'forward'
+                for a in env.agent_states:
+                    if a is not env.primary_agent:
+                        a.next_waypoint = rng.choice(Environment.valid_actions[1:])
+                if env.traffic is not None:
+                    env.traffic.waypoint[:] = [rng.randint(FORWARD, RIGHT) for i in xrange(env.traffic.n_cars)]
+                self.copy_world(batch, k, env)
+                env.primary_agent.action = rng.choice(Environment.valid_actions)
+
+            inputs = batch.observe()
+            rewards = batch.act([Environment.valid_actions.index(env.primary_agent.action) for env in envs])
+            for k, env in enumerate(envs):
+                env.random, env_random = FirstChoice(), env.random
+                if env.traffic is not None:
+                    env.traffic.random, traffic_random = FirstWaypoint(), env.traffic.random
+                env.step()
+                env.random = env_random
+                if env.traffic is not None:
+                    env.traffic.random = traffic_random
+                primary = env.primary_agent
+                self.assertEqual(Environment.valid_actions[inputs['oncoming'][k]], primary.inputs['oncoming'])
+                self.assertEqual(Environment.valid_actions[inputs['left'][k]], primary.inputs['left'])
+                self.assertEqual(Environment.valid_actions[inputs['right'][k]], primary.inputs['right'])
+                self.assertEqual('green' if inputs['light'][k] else 'red', primary.inputs['light'])
+                self.assertEqual(rewards[k], primary.reward)
+                self.assertEqual((batch.done[k], batch.success[k]), (env.done, env.success))
+                self.assertEqual(batch.deadline[k], env.agent_states[primary].deadline)
+                for i, (location, heading, waypoint) in enumerate(self.agents(env)):
+                    self.assertEqual((tuple(batch.location[k, i]), tuple(batch.heading[k, i])), (location, heading))
+                for (x, y), light in env.intersections.iteritems():
+                    self.assertEqual(batch.light_state[k, x - 1, y - 1], light.state)
+
+    def test_observe_and_act(self):
+        self.check_observe_and_act(batched_traffic=False)
+
+    def test_batched_traffic(self):
+        self.check_observe_and_act(batched_traffic=True)
+
+    def test_trip_rules(self):
+        batch = BatchEnvironment(500, grid_size=(6, 5), seed=0, light_periods=(2, 7), min_route_dist=6, deadline_factor=3)
+        batch.reset()
+        distance = np.abs(batch.destination - batch.location[:, batch.primary]).sum(axis=1)
+        self.assertTrue((distance >= 6).all())
+        self.assertTrue((batch.deadline == distance * 3).all())
+        self.assertEqual(set(batch.light_period.flat), set([2, 7]))
+        self.assertRaises(ValueError, BatchEnvironment, 1, grid_size=(3, 3), min_route_dist=5)
+
+    def test_environment_options(self):
+        env_options = {'grid_size': (5, 4), 'traffic_density': 0.5, 'light_periods': (2, 3), 'min_route_dist': 3,
+                       'deadline_factor': 4, 'batched_traffic': True}
+        env = Environment(seed=0, telemetry=Telemetry(SILENT), **env_options)
+        batch = BatchEnvironment(200, seed=0, **env_options)
+        self.assertEqual(batch.num_dummies, env.num_dummies)
+        self.assertEqual(batch.grid_size, env.grid_size)
+        self.assertTrue(batch.batched_traffic)
+        self.assertEqual(set(batch.light_period.flat), set([2, 3]))
+        batch.reset()
+        distance = np.abs(batch.destination - batch.location[:, batch.primary]).sum(axis=1)
+        self.assertTrue((distance >= 3).all())
+        self.assertTrue((batch.deadline == distance * 4).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
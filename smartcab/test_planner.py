@@ -0,0 +1,65 @@
+"""The precomputed waypoint table checked against the original RoutePlanner.next_waypoint branching.
+
+Run from the top-level directory with: python -m unittest discover -s smartcab
+"""
+import itertools
+import unittest
+
+import numpy as np
+
+from environment import Agent, Environment
+from planner import RoutePlanner, WAYPOINTS, compute_waypoint, next_waypoints
+from telemetry import Telemetry, SILENT
+
+
+def original_next_waypoint(location, heading, destination):
+    """RoutePlanner.next_waypoint as it was first written, branch by branch."""
+    delta = (destination[0] - location[0], destination[1] - location[1])
+    if delta[0] == 0 and delta[1] == 0:
+        return None
+    elif delta[0] != 0:  # EW difference
+        if delta[0] * heading[0] > 0:  # facing correct EW direction
+            return 'forward'
+        elif delta[0] * heading[0] < 0:  # facing opposite EW direction
+            return 'right'  # long U-turn
+        elif delta[0] * heading[1] > 0:
+            return 'left'
+        else:
+            return 'right'
+    elif delta[1] != 0:  # NS difference (turn logic is slightly different)
+        if delta[1] * heading[1] > 0:  # facing correct NS direction
+            return 'forward'
+        elif delta[1] * heading[1] < 0:  # facing opposite NS direction
+            return 'right'  # long U-turn
+        elif delta[1] * heading[0] > 0:
+            return 'right'
+        else:
+            return 'left'
+
+
+class WaypointTest(unittest.TestCase):
+
+    def test_table_matches_original_branching(self):
+        for sx, sy, heading in itertools.product((-1, 0, 1), (-1, 0, 1), Environment.valid_headings):
+            self.assertEqual(WAYPOINTS[(sx, sy, heading)], original_next_waypoint((0, 0), heading, (sx, sy)))
+
+    def test_all_routes(self):
+        env = Environment(seed=0, telemetry=Telemetry(SILENT), num_dummies=0)
+        a = env.create_agent(Agent)
+        planner = RoutePlanner(env, a)
+        cases = list(itertools.product(env.locations, env.locations, Environment.valid_headings))
+
+        codes = next_waypoints(np.array([c[0] for c in cases]), np.array([c[2] for c in cases]), np.array([c[1] for c in cases]))
+        for (location, destination, heading), code in zip(cases, codes):
+            expected = original_next_waypoint(location, heading, destination)
+            delta = (destination[0] - location[0], destination[1] - location[1])
+            self.assertEqual(compute_waypoint(delta, heading), expected)
+            self.assertEqual(Environment.valid_actions[code], expected)
+
+            env.place_agent(a, location, heading)
+            planner.destination = destination
+            self.assertEqual(planner.next_waypoint(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""TrafficController checked against the sequential sense rules of Environment and the moves of DummyAgent.
+
+Run from the top-level directory with: python -m unittest discover -s smartcab
+"""
+import unittest
+
+from agent import LearningAgent
+from environment import Environment
+from telemetry import Telemetry, SILENT
+
+
+def original_sense(others, location, heading):
+    """(oncoming, left, right) seen from location with heading, given the (location, heading, waypoint) of every
+    other agent in update order; the override rules of Environment.sense, applied one agent at a time."""
+    oncoming = left = right = None
+    for other_location, other_heading, waypoint in others:
+        if other_location != location or other_heading == heading:
+            continue
+        if heading[0] * other_heading[0] + heading[1] * other_heading[1] == -1:
+            if oncoming != 'left':
+                oncoming = waypoint
+        elif heading[1] == other_heading[0] and -heading[0] == other_heading[1]:
+            if right != 'forward' and right != 'left':
+                right = waypoint
+        else:
+            if left != 'forward':
+                left = waypoint
+    return oncoming, left, right
+
+
+class TrafficControllerTest(unittest.TestCase):
+
+    def test_sense_and_moves(self):
+        for seed in xrange(4):
+            env = Environment(seed=seed, telemetry=Telemetry(SILENT), grid_size=(5, 4), num_dummies=60, batched_traffic=True)
+            env.set_primary_agent(env.create_agent(LearningAgent), enforce_deadline=True)
+            env.create_agent(LearningAgent)
+            traffic = env.traffic
+            for trial in xrange(3):
+                env.reset()
+                while not env.done:
+                    cars = list(traffic.cars())
+                    others = ([(location, heading, waypoint) for location, heading, waypoint, color in cars] +
+                              [(state.location, state.heading, a.get_next_waypoint()) for a, state in env.agent_states.iteritems()])
+                    sensed = [original_sense(others[:i] + others[i + 1:], location, heading) for i, (location, heading, waypoint, color) in enumerate(cars)]
+
+                    # Every car senses all the others (cars, then agents) at the start of the tick
+                    self.assertEqual(zip(*[[Environment.valid_actions[code] for code in codes] for codes in traffic.sense_all()]), sensed)
+
+                    env.step()
+
+                    # ... and then moves by the rules of DummyAgent.update, with the lights of this tick
+                    expected = []
+                    for (location, heading, waypoint, color), (oncoming, left, right) in zip(cars, sensed):
+                        ns_open = env.intersections[location].state
+                        green = (ns_open and heading[1] != 0) or (not ns_open and heading[0] != 0)
+                        if waypoint == 'right':
+                            okay = green or left != 'forward'
+                        elif waypoint == 'forward':
+                            okay = green
+                        else:
+                            okay = green and oncoming not in ('forward', 'right')
+                        if okay:
+                            heading = {'forward': heading, 'left': (heading[1], -heading[0]), 'right': (-heading[1], heading[0])}[waypoint]
+                            location = env.neighbours[location][Environment.valid_headings.index(heading)]
+                        expected.append((location, heading))
+                    self.assertEqual([(location, heading) for location, heading, waypoint, color in traffic.cars()], expected)
+
+                    # Agents sense the cars first, then the other agents in creation order
+                    if not env.done:
+                        others = ([(location, heading, waypoint) for location, heading, waypoint, color in traffic.cars()] +
+                                  [(state.location, state.heading, a.get_next_waypoint()) for a, state in env.agent_states.iteritems()])
+                        for k, (a, state) in enumerate(env.agent_states.iteritems()):
+                            i = traffic.n_cars + k
+                            inputs = env.sense(a)
+                            self.assertEqual((inputs['oncoming'], inputs['left'], inputs['right']),
+                                             original_sense(others[:i] + others[i + 1:], state.location, state.heading))
+
+
+if __name__ == '__main__':
+    unittest.main()
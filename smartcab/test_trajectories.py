@@ -0,0 +1,33 @@
+"""Seeded runs are reproducible: the same seed gives the exact same trajectory.
+
+Run from the top-level directory with: python -m unittest discover -s smartcab
+"""
+import hashlib
+import unittest
+
+import agent
+from telemetry import Telemetry, SILENT
+
+
+class TrajectoryTest(unittest.TestCase):
+    """Two seeded runs, pinned by a digest of their step and trial records.
+
+    The digests were recorded when grid size and traffic became Environment options; the later waypoint table,
+    light schedule and slotted agent state rewrites must not change a single step.
+    """
+
+    expected = {
+        1: (1.0, 'ec1599c89f1c3af17b21803d6116b300'),
+        2: (0.8333333333333334, '05e48e542c222d86a3dfcad888d14322'),
+    }
+
+    def test_seeded_runs(self):
+        for seed, (expected_score, expected_digest) in sorted(self.expected.items()):
+            telemetry = Telemetry(SILENT, record_steps=True)
+            score = agent.run(headless=True, seed=seed, n_trials=60, telemetry=telemetry, env_options={'num_dummies': 20, 'grid_size': (6, 5)})
+            digest = hashlib.md5(telemetry.step_records().tobytes() + telemetry.trial_records().tobytes()).hexdigest()
+            self.assertEqual((score, digest), (expected_score, expected_digest))
+
+
+if __name__ == '__main__':
+    unittest.main()
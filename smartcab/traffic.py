@@ -0,0 +1,144 @@
+import numpy as np
+
+from environment import Environment, DummyAgent, HEADING_CODES
+from batch_environment import NONE, FORWARD, LEFT, RIGHT, dummy_blocked
+from qtable import ACTION_INDEX
+
+# Headings are encoded as indices into Environment.valid_headings (ENWS): a left turn adds 1, a right turn adds 3 (mod 4)
+DX = np.array([heading[0] for heading in Environment.valid_headings])
+DY = np.array([heading[1] for heading in Environment.valid_headings])
+
+
+class TrafficController(object):
+    """All dummy traffic of an Environment as arrays of cars, updated together (Environment(batched_traffic=True)).
+
+    Cars follow the rules of DummyAgent, with one difference: every car senses its intersection as it was at the
+    start of the tick and then all cars move at once, where dummy agents update one after the other (each seeing
+    the moves of those before it). Cars come before all other agents in the update and sense order, like dummy
+    agents do. Intersections are numbered like env.locations: cell = (x - 1) * rows + (y - 1).
+    """
+
+    def __init__(self, env, n_cars):
+        self.env = env
+        self.n_cars = n_cars
+        self.cols, self.rows = env.grid_size
+        self.random = np.random.RandomState(env.random.randint(0, 2**32 - 1))  # seeded from the environment
+
+        self.cell = self.random.randint(0, self.cols * self.rows, size=n_cars)
+        self.heading = np.full(n_cars, HEADING_CODES[(0, 1)], dtype=np.int8)
+        self.waypoint = self.random.randint(FORWARD, RIGHT + 1, size=n_cars).astype(np.int8)
+        self.color = np.array(DummyAgent.color_choices)[self.random.randint(0, len(DummyAgent.color_choices), size=n_cars)]
+
+        self.light_state = None  # light states at t = 0 and periods, by cell (see reset_lights)
+        self.light_period = None
+        self.reset_lights()
+        self.index_cells()
+
+    def reset(self):
+        """Put every car at a random intersection with a random heading."""
+        self.cell = self.random.randint(0, self.cols * self.rows, size=self.n_cars)
+        self.heading = self.random.randint(0, 4, size=self.n_cars).astype(np.int8)
+        self.index_cells()
+
+    def reset_lights(self):
+        """Take the lights' states and periods at t = 0 (lights switch every period ticks from there)."""
+        lights = self.env.intersections.values()
+        self.light_state = np.array([light.state for light in lights], dtype=bool)
+        self.light_period = np.array([light.period for light in lights])
+
+    def index_cells(self):
+        """Sort cars by intersection (then by index), for sense()."""
+        self.order = np.argsort(self.cell, kind='mergesort')
+        self.sorted_cells = self.cell[self.order]
+
+    def green(self, cell, heading, t):
+        """Whether the light at each cell is green for each heading, at tick t."""
+        ns_open = self.light_state[cell] ^ ((t // self.light_period[cell]) % 2 == 1)
+        return ns_open == (heading % 2 == 1)  # N and S have odd codes
+
+    def step(self, t):
+        """Sense and move all cars, for tick t (after the lights were updated)."""
+        if self.n_cars == 0:
+            return
+        oncoming, left, right = self.sense_all()
+        green = self.green(self.cell, self.heading, t)
+        waypoint = self.waypoint
+        moving = ~dummy_blocked(waypoint, green, oncoming, left)
+
+        heading = self.heading[moving]
+        heading = np.where(waypoint[moving] == LEFT, (heading + 1) % 4, np.where(waypoint[moving] == RIGHT, (heading + 3) % 4, heading))
+        cell = self.cell[moving]
+        self.cell[moving] = ((cell // self.rows + DX[heading]) % self.cols) * self.rows + (cell % self.rows + DY[heading]) % self.rows  # wrap-around
+        self.heading[moving] = heading
+        self.waypoint[moving] = self.random.randint(FORWARD, RIGHT + 1, size=moving.sum())
+        self.index_cells()
+
+    def sense_all(self):
+        """Return (oncoming, left, right) action codes for every car, with the Environment.sense priority rules.
+
+        Other agents at the intersection are included after the cars, in creation order.
+        """
+        agents = self.env.agent_states.items()
+        cell = np.concatenate((self.cell, np.array([(state.location[0] - 1) * self.rows + state.location[1] - 1 for agent, state in agents], dtype=int)))
+        heading = np.concatenate((self.heading, np.array([HEADING_CODES[state.heading] for agent, state in agents], dtype=np.int8)))
+        waypoint = np.concatenate((self.waypoint, np.array([ACTION_INDEX[agent.get_next_waypoint()] for agent, state in agents], dtype=np.int8)))
+
+        # Group everyone by (intersection, heading), keeping their order within a group
+        key = cell * 4 + heading
+        order = np.argsort(key, kind='mergesort')
+        key = key[order]
+        waypoint = waypoint[order]
+        n = len(key)
+        starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+        group_key = key[starts]
+        last = waypoint[np.concatenate((starts[1:], [n])) - 1]
+
+        # What a car sees of one group, applying the group's waypoints in order:
+        # oncoming sticks at 'left', left sticks at 'forward', right sticks at the first 'forward' or 'left'
+        seen_oncoming = np.where(np.logical_or.reduceat(waypoint == LEFT, starts), LEFT, last)
+        seen_left = np.where(np.logical_or.reduceat(waypoint == FORWARD, starts), FORWARD, last)
+        first = np.minimum.reduceat(np.where((waypoint == FORWARD) | (waypoint == LEFT), np.arange(n), n), starts)
+        seen_right = np.where(first < n, waypoint[np.minimum(first, n - 1)], last)
+
+        def lookup(query, seen):
+            i = np.minimum(np.searchsorted(group_key, query), len(group_key) - 1)
+            return np.where(group_key[i] == query, seen[i], NONE)
+
+        base = self.cell * 4
+        heading = self.heading.astype(int)
+        return (lookup(base + (heading + 2) % 4, seen_oncoming),
+                lookup(base + (heading + 3) % 4, seen_left),
+                lookup(base + (heading + 1) % 4, seen_right))
+
+    def sense(self, location, heading):
+        """Return (oncoming, left, right) as seen from location with heading, from the cars there only.
+
+        Environment.sense continues from these with the other agents at location.
+        """
+        cell = (location[0] - 1) * self.rows + location[1] - 1
+        h = HEADING_CODES[heading]
+        oncoming = None
+        left = None
+        right = None
+        for i in self.order[np.searchsorted(self.sorted_cells, cell):np.searchsorted(self.sorted_cells, cell, 'right')]:
+            relative = (self.heading[i] - h) % 4
+            if relative == 0:  # same heading
+                continue
+            other_heading = Environment.valid_actions[self.waypoint[i]]
+            if relative == 2:
+                if oncoming != 'left':
+                    oncoming = other_heading
+            elif relative == 1:
+                if right != 'forward' and right != 'left':
+                    right = other_heading
+            else:
+                if left != 'forward':
+                    left = other_heading
+        return oncoming, left, right
+
+    def cars(self):
+        """Yield (location, heading, next waypoint, color) of every car, e.g. for rendering."""
+        for i in xrange(self.n_cars):
+            cell = int(self.cell[i])
+            yield ((cell // self.rows + 1, cell % self.rows + 1), Environment.valid_headings[self.heading[i]],
+                   Environment.valid_actions[self.waypoint[i]], str(self.color[i]))